@@ -19,6 +19,7 @@ from . import findshift
 from . import shiftscore
 from . import datatoexcel
 from . import txtoutput as out
+from . import alignfile
 
 # functions
 # ---------------------- input Data processing ---------------------------#
@@ -100,32 +101,203 @@ def complexome_alignment(template_df, samplelengths, modifieddata, input):
             final_align_length -- integer, number of slices after alignment
             dataloc -- tuple with 2 strings, name of first and last columns containing data
             newdataframe -- pandas df, containing aligned data and columns from template
-            pairwisecosts -- dictionary containing costs of all pairwise alignments
-                          -- format: {'sample1:sample2':cost(type:float)}
+            pairwisecosts -- ndarray, symmetric (samples x samples) matrix with costs of
+                             all pairwise alignments, row/column i belongs to sample i+1.
+                             None if pairwise alignments were skipped (star alignment
+                             to input['star_reference'], or input['guide_costs']
+                             'intensity')
+            approximation_costs -- list of tuples ('sample1:sample2', approximate cost,
+                                   exact cost) for all pairwise alignments, if
+                                   input['report_exact_cost'] in approximate warp mode.
+                                   None otherwise
+            guide_tree -- guide tree used for multiple alignment, nested tuples
+                       -- format: (left subtree, right subtree, cost), sample numbers as leaves
+                       -- None for star alignment
+            warp_operators -- list with sparse warp operator (localdist.CSRMatrix) of each
+                              sample, to warp additional data columns of a sample with
+                              multipletimewarp.apply_warp
+            localdict -- LocalDistStore with local distance grids of all sample pairs
     """
     # CALCULATE LOCAL DISTANCE GRIDS FOR ALL PAIRWISE ALIGNMENTS
     print( "calculating local distances...")
-    localdict = localdist.pairwise_localdist(modifieddata)
-    #print localdict.keys()
+    window = input.get('window')
+    warp_mode = input.get('warp_mode', 'exact')
+    msa_method = input.get('msa_method', 'progressive')
+    if msa_method not in ('progressive', 'star'):
+        raise ValueError('multiple alignment method not recognized!: {}'.format(msa_method))
+    star_reference = input.get('star_reference') if msa_method == 'star' else None
+    guide_costs = input.get('guide_costs', 'alignment')
+    if guide_costs not in ('alignment', 'intensity'):
+        raise ValueError('guide costs not recognized!: {}'.format(guide_costs))
+    # pairwise alignments of all samples are only needed to choose the alignment order
+    skip_pairwise = star_reference is not None or guide_costs == 'intensity'
+    localdist_settings = get_localdist_settings(input)
+    if warp_mode == 'exact':
+        # without pairwise alignments only grids used in the multiple alignment are needed
+        localdict = localdist.pairwise_localdist(modifieddata, window = window, lazy = skip_pairwise,
+                                                 **localdist_settings)
+        coarse = None
+    elif warp_mode == 'approximate':
+        # full resolution local distances are only computed where needed, within corridors
+        factor = input.get('coarse_factor', 4)
+        localdict = localdist.pairwise_localdist(modifieddata, window = window, lazy = True, **localdist_settings)
+        coarsedata = [localdist.coarsen_sample(sample, factor) for sample in modifieddata]
+        coarse_localdict = localdist.pairwise_localdist(coarsedata, **localdist_settings)
+        coarse = (coarse_localdict, factor, input.get('coarse_radius', 2))
+    else:
+        raise ValueError('warp mode not recognized!: {}'.format(warp_mode))
 
     # PERFORM PAIRWISE ALIGNMENTS
-    print( "performing pairwise alignments...")
-    # iterate through all pairwise combinations of samples
-    pairwise_warp = msa_warp.pairwise_timewarp(modifieddata,samplelengths,localdict)
-    pairwisedict = pairwise_warp[0]
-    pairwisecosts = pairwise_warp[1]
-    paircostkeys = pairwisecosts.keys()
+    if not skip_pairwise:
+        print( "performing pairwise alignments...")
+        # iterate through all pairwise combinations of samples
+        pairwise_warp = msa_warp.pairwise_timewarp(modifieddata,samplelengths,localdict,window,coarse,
+                                                   n_jobs = input.get('n_jobs', 1))
+        pairwisedict = pairwise_warp[0]
+        pairwisecosts = pairwise_warp[1]
+        ordercosts = pairwisecosts
+    else:
+        pairwisedict = {}
+        pairwisecosts = None
+        # cheap distances between total intensity traces determine the alignment order
+        ordercosts = msa_warp.trace_costmatrix(modifieddata, window) if guide_costs == 'intensity' else None
+
+    # COMPARE APPROXIMATE PAIRWISE COSTS TO EXACT COSTS, IF REQUESTED
+    approximation_costs = None
+    if coarse is not None and pairwisecosts is not None and input.get('report_exact_cost', False):
+        print( "performing exact pairwise alignments for comparison...")
+        exact_costs = msa_warp.pairwise_timewarp(modifieddata,samplelengths,localdict,window,
+                                                 n_jobs = input.get('n_jobs', 1))[1]
+        approximation_costs = [('{}:{}'.format(sample1, sample2), cost, float(exact_costs[sample1-1, sample2-1]))
+                               for cost, sample1, sample2 in msa_warp.cost_pairs(pairwisecosts)]
 
     # DETERMINE ALINGMENT ORDER FOR MSA, PERFORM ALIGNMENTS
     print( "performing multiple alignments..."   )
-    multiple_alignment = msa_warp.multiple_timewarp(pairwisecosts,samplelengths,localdict,pairwisedict)
+    if msa_method == 'star':
+        # align all samples to the medoid sample, or to the given reference sample
+        guide_tree = None
+        if star_reference is None:
+            star_reference = msa_warp.medoid_sample(ordercosts)
+        multiple_alignment = msa_warp.star_timewarp(star_reference,samplelengths,localdict,window,coarse,
+                                                    n_jobs = input.get('n_jobs', 1))
+    else:
+        # merges in the same level of the guide tree are independent and performed in parallel
+        guide_tree = msa_warp.guide_tree(ordercosts, input.get('linkage', 'single'))
+        multiple_alignment = msa_warp.tree_timewarp(guide_tree,samplelengths,localdict,pairwisedict,window,coarse,
+                                                    n_jobs = input.get('n_jobs', 1),
+                                                    merge_mode = input.get('merge_mode', 'average'))
     final_alignment = multiple_alignment[0]
     multiple_alignment_order = multiple_alignment[1]
+
+    # WARP DATA USING FINAL ALIGNMENT
+    final_align_length, dataloc, newdataframe, warp_operators = warp_data(template_df, samplelengths, modifieddata,
+                                                                          final_alignment, input)
+
+    return (final_alignment, multiple_alignment_order, final_align_length, dataloc, newdataframe, pairwisecosts, approximation_costs, guide_tree, warp_operators, localdict)
+
+def get_localdist_settings(input):
+    """returns dict with local distance settings from input, as keyword arguments for localdist"""
+    return {'engine': input.get('localdist_engine', 'numpy'),
+            'n_jobs': input.get('n_jobs', 1),
+            'dtype': input.get('localdist_dtype', 'float64'),
+            'max_memory': input.get('localdist_memory')}
+
+def saved_alignment(template_df, samplelengths, modifieddata, input):
+    """
+    warps data using the alignment saved by an earlier run (input['load_alignment'])
+
+    Keyword arguments:
+        template_df   -- pandas dataframe, contains all data provided in first dataset.
+                         aligned data is inserted into this template dataframe.
+        samplelengths -- list of ints, number of slices for each sample
+        modifieddata  -- normalised iBAQ data, list in list in list structure
+        input         -- dict, containing all provided input for analysis
+    Returns:
+        tuple with the same results as complexome_alignment. approximation_costs and
+        localdict are None
+    """
+    print( "loading alignment from {}...".format(input['load_alignment']))
+    final_alignment, multiple_alignment_order, pairwisecosts, guide_tree = alignfile.load_alignment(
+        input['load_alignment'], modifieddata)
+
+    # WARP DATA USING FINAL ALIGNMENT
+    final_align_length, dataloc, newdataframe, warp_operators = warp_data(template_df, samplelengths, modifieddata,
+                                                                          final_alignment, input)
+
+    return (final_alignment, multiple_alignment_order, final_align_length, dataloc, newdataframe, pairwisecosts, None, guide_tree, warp_operators, None)
+
+def incremental_alignment(template_df, samplelengths, modifieddata, input):
+    """
+    aligns samples added after an earlier run into the alignment saved by that run
+
+    the saved alignment (input['load_alignment']) belongs to the first samples. local
+    distance grids are only computed for pairs with new samples, grids of the earlier
+    run (input['load_localdist']) are reused.
+    Keyword arguments:
+        template_df   -- pandas dataframe, contains all data provided in first dataset.
+                         aligned data is inserted into this template dataframe.
+        samplelengths -- list of ints, number of slices for each sample
+        modifieddata  -- normalised iBAQ data, list in list in list structure
+        input         -- dict, containing all provided input for analysis
+    Returns:
+        tuple with the same results as complexome_alignment. pairwisecosts,
+        approximation_costs and guide_tree are None
+    """
+    print( "loading alignment from {}...".format(input['load_alignment']))
+    loaded = alignfile.load_alignment(input['load_alignment'], modifieddata, new_samples = True)
+    alignment, multiple_alignment_order = loaded[0], loaded[1]
+    oldnum = len(alignment)
+    window = input.get('window')
+
+    # CALCULATE LOCAL DISTANCE GRIDS FOR PAIRS WITH NEW SAMPLES
+    print( "calculating local distances of new samples...")
+    if input.get('load_localdist'):
+        localdict = localdist.load_store(input['load_localdist'])
+        if localdict.samplenum != oldnum:
+            raise ValueError('local distance file {} contains {} samples, alignment contains {}'.format(
+                input['load_localdist'], localdict.samplenum, oldnum))
+    else:
+        # grids of pairs of aligned samples are not needed to add samples
+        localdict = localdist.LocalDistStore(samplelengths[:oldnum], pairs = [])
+    localdict = localdist.extend_store(localdict, modifieddata, window = window, **get_localdist_settings(input))
+
+    # ADD NEW SAMPLES TO ALIGNMENT
+    print( "adding new samples to alignment...")
+    newsamples = list(range(oldnum+1, len(samplelengths)+1))
+    final_alignment, added_order = msa_warp.add_samples(alignment, newsamples, samplelengths, localdict, window)
+    multiple_alignment_order = multiple_alignment_order + added_order
+
+    # WARP DATA USING FINAL ALIGNMENT
+    final_align_length, dataloc, newdataframe, warp_operators = warp_data(template_df, samplelengths, modifieddata,
+                                                                          final_alignment, input)
+
+    return (final_alignment, multiple_alignment_order, final_align_length, dataloc, newdataframe, None, None, None, warp_operators, localdict)
+
+def warp_data(template_df, samplelengths, modifieddata, final_alignment, input):
+    """
+    warps data using final alignment, inserts warped data in template dataframe
+
+    Keyword arguments:
+        template_df   -- pandas dataframe, contains all data provided in first dataset.
+                         aligned data is inserted into this template dataframe.
+        samplelengths -- list of ints, number of slices for each sample
+        modifieddata  -- normalised iBAQ data, list in list in list structure
+        final_alignment -- dictionary with aligned slice index list for each sample
+                        -- format: {'samplenumber':[slice indices]}
+        input         -- dict, containing all provided input for analysis
+    Returns:
+        tuple containing:
+            final_align_length -- integer, number of slices after alignment
+            dataloc -- tuple with 2 strings, name of first and last columns containing data
+            newdataframe -- pandas df, containing aligned data and columns from template
+            warp_operators -- list with sparse warp operator (localdist.CSRMatrix) of each
+                              sample, to warp additional data columns of a sample with
+                              multipletimewarp.apply_warp
+    """
     final_align_length = len(next(iter(final_alignment.values())))
     samplenum = len(samplelengths)
     align_lengths = [final_align_length] * samplenum    # required as input for some functions, in order for the functions to also be able to handle varying sample lengths
 
-    # WARP DATA USING FINAL ALIGNMENT
     print( "warping data using final multiple alignment...")
     if input['warp_method'] == 'repeat':
         warpeddata = msa_warp.datawarp(modifieddata, final_alignment)
@@ -133,6 +305,7 @@ def complexome_alignment(template_df, samplelengths, modifieddata, input):
         warpeddata = msa_warp.interpolation_warp(modifieddata,final_alignment)
     else:
         raise ValueError('warp method not recognized!: {}'.format(input['warp_method']))
+    warp_operators = msa_warp.warp_operators(final_alignment, samplelengths, input['warp_method'])
 
     #transform warped data to pandas dataframe
     warpeddataframe = datatoexcel.datatoframe(warpeddata, input['samplenames'], align_lengths)
@@ -141,8 +314,7 @@ def complexome_alignment(template_df, samplelengths, modifieddata, input):
     newdataframe = datatoexcel.integratedata(template_df, warpeddataframe, input['samplecolumns'][0], input['identifier'][0])
     dataloc = (input['samplenames'][0] + "_1", input['samplenames'][-1] + "_" + str(align_lengths[-1]))   # headers of first and last data containing columns
 
-    return (final_alignment, multiple_alignment_order, final_align_length, dataloc, newdataframe, pairwisecosts)
-
+    return (final_align_length, dataloc, newdataframe, warp_operators)
 
 # ---------------------- Hausdorff score calculation ---------------------------#
 def hausdorff_scoring(input, final_alignment, final_align_length, dataloc, newdataframe):
@@ -159,13 +331,20 @@ def hausdorff_scoring(input, final_alignment, final_align_length, dataloc, newda
     Returns:
         score_frame -- pandas df containing columns with hausdorff scores
         newdataframe -- pandas df containing aligned data and hausdorff effect sizes
+        fast_counts -- dict, number of hausdorff distances per fast path class, see
+                       findshift.find_hausdorff
     """
     samplenum = len(input['samplenames'])
     align_lengths = [final_align_length] * samplenum
 
     # determine hausdorff distances and combined hausdorff scores
     nakedframe = findshift.strip_frame(newdataframe, dataloc)
-    shift_frame = findshift.find_hausdorff(nakedframe, align_lengths, newdataframe, final_alignment, input['groups'], input['normcol'], input['hausd_factor'])
+    shift_frame, fast_counts = findshift.find_hausdorff(nakedframe, align_lengths, newdataframe, final_alignment, input['groups'], input['normcol'], input['hausd_factor'],
+                                             engine = input.get('hausdorff_engine', 'batch'),
+                                             n_jobs = input.get('n_jobs', 1),
+                                             chunk_size = input.get('hausdorff_chunk_size', findshift.CHUNK_SIZE),
+                                             pairs = hausdorff_pairs(input),
+                                             fast_path = input.get('hausdorff_fast_path', True))
     score_frame = shiftscore.shift_score(shift_frame, input['groups'],input['samplenames'])
 
     # ADD COMBINED SCORE AND INT DIFFS TO MAIN DATAFRAME
@@ -174,7 +353,23 @@ def hausdorff_scoring(input, final_alignment, final_align_length, dataloc, newda
     newdataframe = pd.concat([newdataframe, intensity_diffs, combined_score], axis = 1, sort = True)
     newdataframe.index.name = score_frame.index.name
 
-    return (score_frame, newdataframe)
+    return (score_frame, newdataframe, fast_counts)
+
+def hausdorff_pairs(input):
+    """
+    determines sample pairs to compute hausdorff distances for (input['hausdorff_pairs'])
+
+    Keyword arguments:
+        input -- dict, containing all provided input for analysis
+    Returns:
+        pairs -- list of sample pair headers ('1:2' format), or None for all pairs
+    """
+    mode = input.get('hausdorff_pairs', 'all')
+    if mode == 'all':
+        return None
+    elif mode == 'required':
+        return shiftscore.required_pairs(input['groups'])
+    raise ValueError('hausdorff_pairs not recognized!: {}'.format(mode))
 
 # ---------------------- Output results  ---------------------------#
 def output_results(input, output):
@@ -186,6 +381,8 @@ def output_results(input, output):
         - csv file of aligned profiles
         - csv file of hausdorff scores
         - text file with info on alignment process
+        - .npz file with alignment results, to be loaded with input['load_alignment']
+        - .npz file with local distance grids, if input['save_localdist']
         - .rnk file: ranked list with hausdorff effect size values for GSEA
         - info on alignment process to stdout
     Keyword arguments:
@@ -204,6 +401,8 @@ def output_results(input, output):
     csv_dataframe = input['analysis_name'] + "_dataframe.csv"
     align_info = input['analysis_name'] + "_align_info.txt"
     csv_normdata = input['analysis_name'] + "_normdata.csv"
+    alignment_file = input['analysis_name'] + "_alignment.npz"
+    localdist_file = input['analysis_name'] + "_localdist.npz"
 
     # create output folder, change current directory to output folder
     cwd = os.getcwd()
@@ -238,6 +437,11 @@ def output_results(input, output):
     # PROVIDE ALIGNMENT INFO TEXT OUTPUT (to stdout and .txt file)
     out.text_output(input, output, align_info, output_path)
 
+    # MACHINE READABLE ALIGNMENT OUTPUT (input for 'load_alignment')
+    alignfile.save_alignment(alignment_file, output)
+    if input.get('save_localdist') and output['localdict'] is not None:
+        localdist.save_store(localdist_file, output['localdict'])
+
 def insert_normalised_data(template_df, samplelengths, modifieddata, input):
     """
     alternative function to complexome_alignment if align_check=False
@@ -338,7 +542,71 @@ def main(input = input):
                       hausdorff effect size calculation
             'hausd_factor' (float): ratio of height to width of plain in which hausdorff
                                     distances are calculated
-    Returns None
+            'warp_method': string, 'repeat' or 'interpolate', how gaps are filled when
+                           warping data
+            optional:
+            'localdist_engine': string, 'numpy' (default), 'sparse' or 'reference', engine
+                                used to calculate local distances. 'sparse' is fastest
+                                for profiles that are mostly zero
+            'n_jobs': int, number of worker processes used for parallel computations
+                      (default 1: no parallelism, -1: all cpus)
+            'localdist_dtype': string, 'float64' (default) or 'float32', float type in
+                               which local distance grids are stored
+            'localdist_memory': number, memory budget in MB for temporary arrays used
+                                per local distance grid computation (default 32). sample
+                                data and stored grids come on top of the budget
+            'window': int (slices) or float < 1 (fraction of sample length), width of
+                      warping window around the diagonal (default None: no window)
+            'warp_mode': string, 'exact' (default) or 'approximate'. approximate warps
+                         slice-binned samples first, and refines the alignment at full
+                         resolution only within a corridor around the binned alignment
+            'coarse_factor': int, number of slices per bin in approximate mode (default 4)
+            'coarse_radius': int, corridor radius in slices in approximate mode (default 2)
+            'report_exact_cost': boolean, in approximate mode also perform exact pairwise
+                                 alignments and report cost differences (default False)
+            'linkage': string, 'single' (default) or 'average' (UPGMA), linkage used to
+                       build the guide tree for multiple alignment
+            'merge_mode': string, 'average' (default) or 'profile'. 'profile' scores
+                          merges of partial alignments against their consensus profiles
+                          (mean warped intensities), so merge costs do not grow with the
+                          number of samples in the partial alignments
+            'msa_method': string, 'progressive' (default) or 'star'. 'star' aligns all
+                          samples to one reference sample and merges these alignments
+            'star_reference': int, sample number (starting at 1) of the reference sample
+                              for star alignment. pairwise alignments of all samples are
+                              skipped. default None: the medoid sample, with the lowest
+                              total pairwise alignment cost
+            'guide_costs': string, 'alignment' (default) or 'intensity', sample distances
+                           used for the alignment order (guide tree or star reference).
+                           'intensity' timewarps total intensity traces of the samples
+                           instead of performing pairwise alignments of all samples, so
+                           only the alignments of the multiple alignment are performed
+            'load_alignment': string, path of _alignment.npz file saved by an earlier run
+                              on the same data. alignment is skipped, data is warped using
+                              the loaded alignment (default None: perform alignment)
+            'incremental': boolean, with 'load_alignment': samples after the samples of
+                           the loaded alignment are new, and are aligned into the loaded
+                           alignment (default False)
+            'load_localdist': string, path of _localdist.npz file saved by the run that
+                              saved the loaded alignment, reused in incremental mode
+            'save_localdist': boolean, save local distance grids in _localdist.npz file,
+                              for later incremental runs (default False)
+            'hausdorff_engine': string, 'batch' (default), 'ordered' or 'reference', engine
+                                used to calculate hausdorff distances. 'batch' computes
+                                all proteins at once, 'ordered' uses an exact expanding
+                                window search per protein
+            'hausdorff_chunk_size': int, number of proteins per hausdorff task; chunks are
+                                    scored in parallel with n_jobs workers (default 500)
+            'hausdorff_pairs': string, 'all' (default): hausdorff distances of all sample
+                               pairs in the score output, 'required': only the pairs used
+                               by the between and within group scores
+            'hausdorff_fast_path': boolean, take hausdorff distances of all zero, identical
+                                   and single peak samples from closed forms instead of
+                                   computing them (default True)
+    Returns:
+        output -- dict, containing results produced during COPAL analysis. with
+                  alignment, output['warp_operators'] can be used to warp additional
+                  data columns of each sample (multipletimewarp.apply_warp)
     """
     output = {}
 
@@ -350,13 +618,23 @@ def main(input = input):
     output['original_frame_lengths'] = processed_input[4]
 
     if input['align_check']:
-        align_result = complexome_alignment(matched_dataframes[0], output['samplelengths'], modifieddata, input)
+        if input.get('load_alignment') and input.get('incremental'):
+            align_result = incremental_alignment(matched_dataframes[0], output['samplelengths'], modifieddata, input)
+        elif input.get('load_alignment'):
+            align_result = saved_alignment(matched_dataframes[0], output['samplelengths'], modifieddata, input)
+        else:
+            align_result = complexome_alignment(matched_dataframes[0], output['samplelengths'], modifieddata, input)
         output['final_alignment'] = align_result[0]
         output['multiple_alignment_order'] = align_result[1]
         output['final_align_length'] = align_result[2]
         output['dataloc'] = align_result[3]
         output['newdataframe'] = align_result[4]
         output['pairwisecosts'] = align_result[5]
+        output['approximation_costs'] = align_result[6]
+        output['guide_tree'] = align_result[7]
+        output['warp_operators'] = align_result[8]
+        output['localdict'] = align_result[9]
+        output['sample_hashes'] = alignfile.sample_hashes(modifieddata)
 
         normdataloc, normdataframe = insert_normalised_data(matched_dataframes[0],output['samplelengths'],modifieddata,input)
         output['normdataloc'] = normdataloc
@@ -369,19 +647,26 @@ def main(input = input):
         output['dataloc'] = dataloc
         output['newdataframe'] = newdataframe
         output['pairwisecosts'] = None
+        output['approximation_costs'] = None
+        output['guide_tree'] = None
+        output['warp_operators'] = None
+        output['localdict'] = None
 
     if input['hausdorff_scoring']:
         hausdorff_result = hausdorff_scoring(input, output['final_alignment'], output['final_align_length'],
                                              output['dataloc'], output['newdataframe'])
         output['score_frame'] = hausdorff_result[0]
         output['newdataframe'] = hausdorff_result[1]
+        output['hausdorff_fast_path'] = hausdorff_result[2]
     else:
         output['score_frame'] = None
+        output['hausdorff_fast_path'] = None
 
     if input['align_check']:
         output_results(input, output)
     else:
         output_norm_results(input, output)
+    return output
 
 if __name__ == "__main__":
 
@@ -0,0 +1,98 @@
+"""
+alignfile module: saves and loads alignment results, to warp and score data again
+without realigning
+
+part of: COPAL -- COmplexome Profile ALignment Tool
+Copyright (C) 2018  Radboud universitair medisch centrum
+    for full notice, reference readme.md
+"""
+# import statements
+import hashlib
+import json
+import numpy as np
+
+# functions
+def sample_hashes(data):
+    """
+    computes a hash of the (normalised) intensities of each sample
+
+    proteins without intensities in a sample are left out, so hashes do not change when
+    samples are complemented with the (all zero) proteins of added samples.
+    Args:
+        data: 3D list structure or list of 2D np arrays (slices, proteins) with complexome
+              profile sample intensity values
+    Returns:
+        hashes (list): sha1 hex digest (str) of each sample
+    """
+    hashes = []
+    for sample in data:
+        sample = np.asarray(sample, dtype = np.float64)
+        sample = np.ascontiguousarray(sample[:, sample.any(axis = 0)])
+        digest = hashlib.sha1(str(sample.shape).encode())
+        digest.update(sample.tobytes())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+def as_tuples(structure):
+    """converts nested lists (as read from json) back to nested tuples"""
+    if isinstance(structure, list):
+        return tuple(as_tuples(item) for item in structure)
+    return structure
+
+def save_alignment(filename, output):
+    """
+    saves alignment results in a compressed .npz file
+
+    Args:
+        filename (str): name of .npz file
+        output (dict): results of COPAL analysis, containing 'final_alignment',
+                       'multiple_alignment_order', 'pairwisecosts', 'guide_tree',
+                       'samplelengths' and 'sample_hashes'
+    Returns:
+        None
+    """
+    arrays = {}
+    for sample, indices in output['final_alignment'].items():
+        arrays['alignment_' + sample] = np.asarray(indices, dtype = np.int64)
+    if output['pairwisecosts'] is not None:
+        arrays['pairwisecosts'] = output['pairwisecosts']
+    arrays['samplelengths'] = np.asarray(output['samplelengths'], dtype = np.int64)
+    arrays['sample_hashes'] = np.asarray(output['sample_hashes'])
+    arrays['multiple_alignment_order'] = np.asarray(json.dumps(output['multiple_alignment_order']))
+    arrays['guide_tree'] = np.asarray(json.dumps(output['guide_tree']))
+    np.savez_compressed(filename, **arrays)
+
+def load_alignment(filename, data = None, new_samples = False):
+    """
+    loads alignment results saved with save_alignment
+
+    Args:
+        filename (str): name of .npz file
+        data: 3D list structure or list of 2D np arrays with (normalised) sample
+              intensity values the alignment is applied to. if given, the samples are
+              checked against the sample hashes stored with the alignment
+        new_samples (bool): if True, data may contain more samples than the alignment.
+                            the first samples of data are checked against the alignment
+    Returns:
+        final alignment(dict): samples as keys (str), aligned slice indices values (list)
+        multiple_alignment_order (list of tuples): multiple alignment order
+        pairwisecosts (ndarray): pairwise alignment cost matrix, None if not saved
+        guide_tree: guide tree used for multiple alignment, None for star alignment
+    """
+    with np.load(filename, allow_pickle = False) as arrays:
+        samplelengths = arrays['samplelengths'].tolist()
+        if data is not None:
+            if len(data) < len(samplelengths) or (len(data) > len(samplelengths) and not new_samples):
+                raise ValueError('alignment file {} contains {} samples, data contains {}'.format(
+                    filename, len(samplelengths), len(data)))
+            mismatches = [str(sample+1) for sample, (saved, current) in
+                          enumerate(zip(arrays['sample_hashes'].tolist(), sample_hashes(data[:len(samplelengths)]))) if saved != current]
+            if mismatches:
+                raise ValueError('data of samples {} does not match alignment file {}'.format(
+                    ', '.join(mismatches), filename))
+        final_alignment = dict((str(sample), arrays['alignment_' + str(sample)].tolist())
+                               for sample in range(1, len(samplelengths)+1))
+        pairwisecosts = arrays['pairwisecosts'] if 'pairwisecosts' in arrays.files else None
+        msa_order = [as_tuples(entry) for entry in json.loads(str(arrays['multiple_alignment_order']))]
+        guide_tree = as_tuples(json.loads(str(arrays['guide_tree'])))
+    return (final_alignment, msa_order, pairwisecosts, guide_tree)
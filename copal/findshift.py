@@ -9,6 +9,13 @@ Copyright (C) 2018  Radboud universitair medisch centrum
 import pandas as pd
 import numpy as np
 from . import hausdorff
+from . import parallel
+
+# number of proteins scored per parallel task in find_hausdorff
+CHUNK_SIZE = 500
+
+# distance functions of the per protein hausdorff engines
+DISTANCES = {'reference': hausdorff.hausdorff, 'ordered': hausdorff.ordered_hausdorff}
 
 # functions
 def strip_frame(dataframe, dataloc):
@@ -59,6 +66,31 @@ def get_headers(samplenum):
         del targets[0]
     return headers
 
+def select_headers(samplenum, pairs = None):
+    """
+    gets headers of the sample pairs to compute hausdorff distances for, in get_headers order
+
+    Keyword arguments:
+        samplenum -- number of samples
+        pairs -- list of sample pair headers ('1:2' or '2:1' format), None: all pairs
+    Returns headers -- list of selected pairwise combinations in '1:2' format
+    """
+    headers = get_headers(samplenum)
+    if pairs is None:
+        return headers
+    selected = set()
+    for pair in pairs:
+        sample1, sample2 = sorted(int(sample) for sample in str(pair).split(':'))
+        header = "%s:%s"%(sample1, sample2)
+        if header not in headers:
+            raise ValueError('sample pair not in data: {}'.format(pair))
+        selected.add(header)
+    return [header for header in headers if header in selected]
+
+def header_pairs(headers):
+    """converts '1:2' format headers to tuples of sample indices (starting at 0)"""
+    return [tuple(int(sample) - 1 for sample in header.split(':')) for header in headers]
+
 def get_normlist(dataframe, target_frame, normcolumn):
     """
     takes normcolumn from complexome profile frame, adds to hausdorff score frame
@@ -75,7 +107,9 @@ def get_normlist(dataframe, target_frame, normcolumn):
     new_frame = pd.concat([target_frame, normlist], axis = 1)
     return new_frame
 
-def find_hausdorff(dataframe, samplelengths, mainframe, alignment, groups, normcolumn, norm_factor):
+def find_hausdorff(dataframe, samplelengths, mainframe, alignment, groups, normcolumn, norm_factor,
+                   engine = 'reference', n_jobs = 1, chunk_size = CHUNK_SIZE, pairs = None,
+                   fast_path = True):
     """
     calculates hausdorff scores, stores results in new dataframe
 
@@ -90,54 +124,192 @@ def find_hausdorff(dataframe, samplelengths, mainframe, alignment, groups, normc
         normcolumn -- string, header of column from mainframe containing normalisation
         norm_factor (float): factor that determines ratio between plain height and width
                              height = width (align length) * norm_factor
+        engine -- string, hausdorff engine to use:
+                - 'reference': one protein and sample pair at a time
+                - 'ordered': one protein and sample pair at a time, with the exact
+                             expanding window search of hausdorff.ordered_hausdorff
+                - 'batch': all proteins at once, in blocks of broadcast numpy operations.
+                           requires samples of equal length (aligned samples)
+        n_jobs -- int, number of worker processes scoring protein chunks, see
+                  parallel.worker_count
+        chunk_size -- int, number of proteins scored per task
+        pairs -- list of sample pair headers ('1:2' format) to compute distances for, in
+                 any order. None: all sample pairs (get_headers)
+        fast_path -- boolean, take distances of all zero, identical and single peak samples
+                     from hausdorff.fast_distances instead of computing them (samples of
+                     equal length only). gives the same distances
     Returns:
         dist_frame -- pandas dataframe containing:
-                        - hausdorff distances between sample pairs for each protein
+                        - hausdorff distances between (given) sample pairs for each protein
                         - normalisation column
                         - intesity differences: differences in protein abundance between
                                                 sample groups.
                                                (group2_intensity/group1_intensity)
+        fast_counts -- dict, number of proteins ('proteins') and all zero proteins
+                       ('zero rows'), and number of distances ('distances') per class of
+                       hausdorff.FAST_CLASSES
     """
     print("determining hausdorff distances...")
-    distdata = []
-    intensity_diffs = []
-    counter = 1
-    total = dataframe.shape[0]
-    for row in dataframe.itertuples():
-        print("\rcomputing hausdorff for protein {} of {}...      ".format(counter, total), end="", flush=True)
-        index = row[0]
-        data = list(row)[1:]
-        slices = slicer(data, samplelengths)   # slice rows into seperate series per sample
-        intensity_diffs.append(intensity_diff(slices, groups, alignment))
-        slices = hausdorff.square_series(slices, norm_factor)    # create square 2D plane
-        hausdorffs = pairwise_hausdorff(slices) # calculate hausdorff distances
-        distdata.append((index, hausdorffs))
-        counter += 1
-    print()
+    if engine != 'batch' and engine not in DISTANCES:
+        raise ValueError('hausdorff engine not recognized!: {}'.format(engine))
+    if engine == 'batch' and len(set(samplelengths)) > 1:
+        raise ValueError('samples of unequal length, tensor requires aligned samples: {}'.format(samplelengths))
+    if chunk_size < 1:
+        raise ValueError('chunk size should be at least 1: {}'.format(chunk_size))
     samplenum = len(samplelengths)
-    headers = get_headers(samplenum)
-    dist_frame = pd.DataFrame.from_items(distdata, orient = 'index', columns = headers)
+    headers = select_headers(samplenum, pairs)
+    values = np.array(dataframe.values, dtype = float)
+    total = len(values)
+    chunks = [values[start:start+chunk_size] for start in range(0, total, chunk_size)]
+    shared_data = {'samplelengths': samplelengths, 'alignment': alignment, 'groups': groups,
+                   'norm_factor': norm_factor, 'engine': engine, 'pairs': header_pairs(headers),
+                   'fast_path': fast_path and len(set(samplelengths)) == 1}
+    def progress(done):
+        print("\rcomputed hausdorff for {} of {} proteins...      ".format(min(done*chunk_size, total), total),
+              end = "", flush = True)
+    results = parallel.parallel_map(chunk_hausdorff, chunks, n_jobs, shared_data, progress = progress)
+    print()
+    # chunks are returned in order, reassemble them in protein order
+    distances = np.zeros((total, len(headers)))
+    if results:
+        distances = np.concatenate([result[0] for result in results])
+    intensity_diffs = [diff for result in results for diff in result[1]]
+    fast_counts = {'proteins': total, 'zero rows': sum(result[3] for result in results),
+                   'distances': total * len(headers)}
+    class_counts = sum((result[2] for result in results), np.zeros(len(hausdorff.FAST_CLASSES), dtype = int))
+    for fast_class, count in zip(hausdorff.FAST_CLASSES, class_counts):
+        fast_counts[fast_class] = int(count)
+    dist_frame = dist_data_frame(distances, intensity_diffs, dataframe, mainframe, headers, normcolumn)
+    return dist_frame, fast_counts
+
+def chunk_hausdorff(values):
+    """
+    calculates hausdorff distances and intensity differences for a chunk of proteins,
+    using the settings shared by find_hausdorff through parallel_map
+
+    Keyword arguments:
+        values -- 2D np array (proteins, slices of all samples), profiles of the chunk
+    Returns:
+        distances -- 2D np array (proteins, sample pairs)
+        intensity_diffs -- list of intensity differences, one per protein
+        class_counts -- 1D np array, number of distances per class of
+                        hausdorff.FAST_CLASSES
+        zero_rows -- int, number of proteins without intensity (fast path only)
+    """
+    samplelengths = parallel.shared['samplelengths']
+    alignment = parallel.shared['alignment']
+    groups = parallel.shared['groups']
+    norm_factor = parallel.shared['norm_factor']
+    engine = parallel.shared['engine']
+    pairs = parallel.shared['pairs']
+    fast_path = parallel.shared['fast_path']
+    zero_rows = 0
+    if engine == 'batch' or fast_path:
+        tensor = profile_tensor(values, samplelengths)
+        tensor[:, gap_mask(alignment, len(samplelengths), tensor.shape[2])] = 0   # as gap_correct, before scoring
+        squared = hausdorff.square_tensor(tensor, norm_factor)
+    if fast_path:
+        distances, classes = hausdorff.fast_distances(squared, pairs)
+        zero_rows = int(np.sum(~squared.reshape(len(squared), -1).any(axis = 1)))
+    else:
+        distances = np.full((len(values), len(pairs)), np.nan)
+        classes = np.zeros(distances.shape, dtype = int)
+    if engine == 'batch':
+        for column, pair in enumerate(pairs):        # only proteins without fast path distance
+            rows = np.flatnonzero(classes[:, column] == 0)
+            if len(rows):
+                distances[rows, column] = hausdorff.batch_hausdorff(squared[rows], [pair])[:, 0]
+        intensity_diffs = list(batch_intensity_diff(tensor, groups))
+    else:
+        distance = DISTANCES[engine]
+        intensity_diffs = []
+        for row, data in enumerate(values.tolist()):
+            slices = slicer(data, samplelengths)   # slice rows into seperate series per sample
+            intensity_diffs.append(intensity_diff(slices, groups, alignment))
+            slices = hausdorff.square_series(slices, norm_factor)    # create square 2D plane
+            for column in np.flatnonzero(classes[row] == 0):     # calculate remaining hausdorff distances
+                sample1, sample2 = pairs[column]
+                distances[row, column] = distance(slices[sample1], slices[sample2])
+    class_counts = np.bincount(classes.ravel(), minlength = len(hausdorff.FAST_CLASSES))
+    return distances, intensity_diffs, class_counts, zero_rows
+
+def dist_data_frame(distances, intensity_diffs, dataframe, mainframe, headers, normcolumn):
+    """
+    wraps hausdorff distances and intensity differences of all proteins in a dataframe
+
+    Keyword arguments:
+        distances -- 2D np array or list of lists (proteins, sample pairs), hausdorff
+                     distances
+        intensity_diffs -- list or 1D np array, intensity difference of each protein
+        dataframe -- stripped pandas dataframe containing just complexome profiling data
+        mainframe -- pandas df, complexome data containing extra columns (normcol etc)
+        headers -- list of sample pair headers, see get_headers
+        normcolumn -- string, header of column from mainframe containing normalisation
+    Returns:
+        dist_frame -- pandas dataframe, see find_hausdorff
+    """
+    dist_frame = pd.DataFrame(np.asarray(distances, dtype = float).reshape(len(dataframe), len(headers)),
+                              index = dataframe.index, columns = headers)
     if normcolumn != None:
         dist_frame = get_normlist(mainframe, dist_frame, normcolumn)
     dist_frame['intensity diffs'] = intensity_diffs
     dist_frame.index.name = dataframe.index.name
     return dist_frame
 
-def pairwise_hausdorff(slices):
+def profile_tensor(dataframe, samplelengths):
+    """
+    converts stripped dataframe to 3D np array (proteins, samples, slices)
+
+    Keyword arguments:
+        dataframe -- stripped pandas dataframe containing just complexome profiling data,
+                     or 2D np array of its values
+        samplelengths -- list of numbers, number of slices for each sample (all equal)
+    Returns:
+        tensor -- 3D np array of intensity values
+    """
+    if len(set(samplelengths)) > 1:
+        raise ValueError('samples of unequal length, tensor requires aligned samples: {}'.format(samplelengths))
+    values = np.array(dataframe, dtype = float)
+    return values.reshape(len(values), len(samplelengths), samplelengths[0])
+
+def gap_mask(alignments, samplenum, length):
+    """
+    marks alignment gaps (repeated slice indices) of all samples
+
+    Keyword arguments:
+        alignments -- final alignment result, dictionary with aligned slice index list for
+                     each sample
+        samplenum -- number of samples
+        length -- number of aligned slices
+    Returns:
+        mask -- 2D boolean np array (samples, slices), True at gaps
+    """
+    mask = np.zeros((samplenum, length), dtype = bool)
+    for sample in range(samplenum):
+        alignment = np.asarray(alignments[str(sample+1)])
+        mask[sample, 1:] = alignment[1:] == alignment[:-1]
+    return mask
+
+def pairwise_hausdorff(slices, distance = hausdorff.hausdorff, pairs = None):
     """
     determines hausdorff distance between pairwise combinations of given sample series
 
     Keyword arguments:
         slices -- list, containing list with intensity values for each protein
+        distance -- function determining hausdorff distance between two series
+        pairs -- list of tuples (sample1, sample2) of sample indices (starting at 0)
+                 None: all pairwise combinations, in order
     Returns:
-        hausdorffs -- list of hausdorff distances for each pairwise combination
+        hausdorffs -- list of hausdorff distances for each (given) pairwise combination
     """
+    if pairs is not None:
+        return [distance(slices[sample1], slices[sample2]) for sample1, sample2 in pairs]
     samples = slices[:-1]
     targets = slices[1:]
     hausdorffs = []
     for sample in samples:
         for target in targets:
-            hausdorffs.append(hausdorff.hausdorff(sample, target))
+            hausdorffs.append(distance(sample, target))
         del targets[0]
     return hausdorffs
 
@@ -160,6 +332,26 @@ def gap_correct(alignments, slices):
                     slices[slice][i] = 0
     return slices
 
+def batch_intensity_diff(tensor, groups):
+    """
+    calculates original intensity difference between sample groups for all proteins
+
+    Keyword arguments:
+        tensor -- 3D np array (proteins, samples, slices), gap corrected intensity values
+        groups -- list of 2 lists containing sample numbers for groups to be used for
+                      calculation of intensity difference between sample groups
+    Returns
+        1D np array with average_group1_intensity/average_group_2_intensity of each
+        protein, NaN where the average intensity of a group == 0
+    """
+    totals = tensor.sum(axis = 2)
+    avg_group1_intensity = totals[:, np.asarray(groups[0]) - 1].mean(axis = 1)
+    avg_group2_intensity = totals[:, np.asarray(groups[1]) - 1].mean(axis = 1)
+    diffs = np.full(len(tensor), np.nan)
+    valid = (avg_group1_intensity != 0) & (avg_group2_intensity != 0)
+    diffs[valid] = avg_group1_intensity[valid] / avg_group2_intensity[valid]
+    return diffs
+
 def intensity_diff(slices, groups, alignment):
     """
     calculates original intensity difference between sample groups
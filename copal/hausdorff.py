@@ -10,6 +10,12 @@ Copyright (C) 2018  Radboud universitair medisch centrum
 import math
 import numpy as np
 
+# maximum number of elements of temporary arrays in batch_hausdorff
+BLOCK_ELEMENTS = 2**22
+
+# classes of sample pairs in fast_distances, 'computed' pairs need a full computation
+FAST_CLASSES = ('computed', 'zero', 'identical', 'zero vs nonzero', 'single peak')
+
 # functions
 def convert_set(series):
     """converts 1dimensional series to two dimensional np array """
@@ -52,6 +58,50 @@ def hausdorff(left, right):
     hausdorff = max(first_side,second_side)
     return hausdorff
 
+def ordered_one_sided(template, target, lower = 0.0):
+    """
+    determine squared one-sided hausdorff distance from template to target series
+
+    exact search exploiting the integer x coordinates 0..n-1 of series points: the
+    nearest target point of each template point is searched in an expanding window
+    around its own index. candidates k indices away are at least k away, so the
+    search of a point stops once its nearest distance found is within k. points whose
+    nearest distance cannot exceed the distance already known to be reached by
+    another point are dropped early (Taha & Hanbury).
+    Args:
+        template/target: 1D np arrays with series values
+        lower (float): squared distance known to be reached (for example the other
+                       one-sided distance), points below it are not searched further
+    Returns:
+        squared one-sided hausdorff distance, or a value <= lower if that is larger
+    """
+    best = np.full(len(template), np.inf)
+    active = np.arange(len(template))
+    k = 0
+    while len(active):
+        for indices in ((active,) if k == 0 else (active - k, active + k)):
+            valid = (indices >= 0) & (indices < len(target))
+            points = active[valid]
+            distances = k*k + np.square(template[points] - target[indices[valid]])
+            best[points] = np.minimum(best[points], distances)
+        k += 1
+        # nearest distance of each point is at least min(best, k*k): points not yet
+        # visited are k or more indices away
+        lower = max(lower, np.minimum(best[active], k*k).max())
+        active = active[(best[active] > k*k) & (best[active] > lower)]
+    return best.max()
+
+def ordered_hausdorff(left, right):
+    """
+    determine hausdorff distance between two (list-like) series, with the expanding
+    window search of ordered_one_sided. gives the same distance as hausdorff
+    """
+    left = np.asarray(left, dtype = float)
+    right = np.asarray(right, dtype = float)
+    first_side = ordered_one_sided(left, right)
+    second_side = ordered_one_sided(right, left, first_side)
+    return math.sqrt(max(first_side, second_side))
+
 def square_series(slices, norm_factor):
     """
     normalises list of protein intensity values per sample
@@ -78,8 +128,136 @@ def square_series(slices, norm_factor):
     else:
         return slices
 
-def new_square_series():
-    pass
+def square_tensor(tensor, norm_factor):
+    """
+    normalises intensity values of each protein across samples, see square_series
+
+    Args:
+        tensor: 3D np array (proteins, samples, slices) with intensity values
+        norm_factor (float): factor that determines ratio between plain height and width
+    Returns:
+        tensor: 3D np array with normalised intensity values. rows of proteins with
+                maximum intensity 0 are left unchanged
+    """
+    plain_height = tensor.shape[2] * float(norm_factor)
+    maxima = tensor.reshape(len(tensor), -1).max(axis = 1) if tensor.size else np.zeros(len(tensor))
+    factors = np.ones(len(tensor))
+    nonzero = maxima != 0
+    factors[nonzero] = plain_height / maxima[nonzero]
+    return tensor * factors[:, np.newaxis, np.newaxis]
+
+def batch_hausdorff(tensor, pairs = None, block_elements = None):
+    """
+    determines hausdorff distances between sample pairs for all proteins at once
+
+    the points of a series are (slice index, value). squared point distances of a
+    block of proteins are computed in one broadcast operation, both one-sided distances
+    are taken from the same distance grids. gives the same distances as hausdorff.
+    Args:
+        tensor: 3D np array (proteins, samples, slices) with (normalised) intensity values
+        pairs (list): tuples (sample1, sample2) of sample indices (starting at 0).
+                      None: all pairs sample1 < sample2, in order
+        block_elements (int): maximum number of elements of temporary distance arrays
+                              (default: BLOCK_ELEMENTS)
+    Returns:
+        distances: 2D np array (proteins, pairs) with hausdorff distances
+    """
+    tensor = np.asarray(tensor, dtype = float)
+    proteins, samples, slices = tensor.shape
+    if pairs is None:
+        pairs = [(sample1, sample2) for sample1 in range(samples) for sample2 in range(sample1+1, samples)]
+    block_elements = block_elements or BLOCK_ELEMENTS
+    block = max(1, block_elements // max(1, slices * slices))     # proteins per block
+    positions = np.arange(slices, dtype = float)
+    xdist = np.square(positions[:, np.newaxis] - positions[np.newaxis, :])
+    distances = np.empty((proteins, len(pairs)))
+    for start in range(0, proteins, block):
+        values = tensor[start:start+block]
+        for column, (sample1, sample2) in enumerate(pairs):
+            ydiff = values[:, sample1, :, np.newaxis] - values[:, sample2, np.newaxis, :]
+            squared = xdist + np.square(ydiff)                     # (proteins, slices1, slices2)
+            first_side = squared.min(axis = 2).max(axis = 1)
+            second_side = squared.min(axis = 1).max(axis = 1)
+            distances[start:start+block, column] = np.sqrt(np.maximum(first_side, second_side))
+    return distances
+
+def fast_distances(tensor, pairs = None):
+    """
+    determines hausdorff distances of sample pairs that have a closed form, without search
+
+    sample pairs are classified per protein as:
+        - 'zero': both samples all zero, distance 0
+        - 'identical': identical (nonzero) samples, distance 0
+        - 'zero vs nonzero': one sample all zero, distance is the largest absolute value
+                             of the other sample
+        - 'single peak': both samples have a single nonzero slice, distance follows from
+                         the peaks and their neighbouring zero points
+    remaining pairs are 'computed': they need a full hausdorff computation. gives the same
+    distances as hausdorff, for samples of equal length.
+    Args:
+        tensor: 3D np array (proteins, samples, slices) with (normalised) intensity values
+        pairs (list): tuples (sample1, sample2) of sample indices (starting at 0).
+                      None: all pairs sample1 < sample2, in order
+    Returns:
+        distances: 2D np array (proteins, pairs) with hausdorff distances, NaN for pairs
+                   that have to be computed
+        classes: 2D int np array (proteins, pairs), index of class in FAST_CLASSES
+    """
+    tensor = np.asarray(tensor, dtype = float)
+    proteins, samples, slices = tensor.shape
+    if pairs is None:
+        pairs = [(sample1, sample2) for sample1 in range(samples) for sample2 in range(sample1+1, samples)]
+    nonzero = np.count_nonzero(tensor, axis = 2)            # (proteins, samples)
+    peaks = np.argmax(tensor != 0, axis = 2)                 # first nonzero slice of each sample
+    heights = np.take_along_axis(tensor, peaks[:, :, np.newaxis], axis = 2)[:, :, 0]
+    distances = np.full((proteins, len(pairs)), np.nan)
+    classes = np.zeros((proteins, len(pairs)), dtype = int)
+    for column, (sample1, sample2) in enumerate(pairs):
+        left = tensor[:, sample1]
+        right = tensor[:, sample2]
+        identical = np.all(left == right, axis = 1)
+        zero = identical & (nonzero[:, sample1] == 0)
+        one_zero = ~identical & ((nonzero[:, sample1] == 0) | (nonzero[:, sample2] == 0))
+        single = ~identical & (nonzero[:, sample1] == 1) & (nonzero[:, sample2] == 1)
+        classes[zero, column] = FAST_CLASSES.index('zero')
+        classes[identical & ~zero, column] = FAST_CLASSES.index('identical')
+        classes[one_zero, column] = FAST_CLASSES.index('zero vs nonzero')
+        classes[single, column] = FAST_CLASSES.index('single peak')
+        distances[identical, column] = 0.0
+        distances[one_zero, column] = np.abs(left[one_zero] - right[one_zero]).max(axis = 1)
+        peak1, height1 = peaks[single, sample1], heights[single, sample1]
+        peak2, height2 = peaks[single, sample2], heights[single, sample2]
+        squared = np.maximum(peak_one_sided(peak1, height1, peak2, height2, slices),
+                             peak_one_sided(peak2, height2, peak1, height1, slices))
+        distances[single, column] = np.sqrt(squared)
+    return distances, classes
+
+def peak_one_sided(template_peak, template_height, target_peak, target_height, slices):
+    """
+    determines squared one-sided hausdorff distances between single peak series
+
+    a single peak series is zero everywhere, except at its peak. only the template peak
+    and the template zero point at the target peak are not matched exactly by a target
+    point, the other template points have distance 0.
+    Args:
+        template_peak, template_height: 1D np arrays, peak slice and value of templates
+        target_peak, target_height: 1D np arrays, peak slice and value of targets
+        slices (int): number of slices of each series
+    Returns:
+        squared: 1D np array, squared one-sided hausdorff distances
+    """
+    squared = peak_point_distance(template_peak, template_height, target_peak, target_height, slices)
+    at_peak = peak_point_distance(target_peak, np.zeros(len(target_peak)), target_peak, target_height, slices)
+    return np.where(template_peak != target_peak, np.maximum(squared, at_peak), squared)
+
+def peak_point_distance(position, value, target_peak, target_height, slices):
+    """squared distance of points (position, value) to closest point of single peak targets"""
+    position = np.asarray(position, dtype = float)
+    zero_dist = np.square(value)                            # closest zero point at same slice
+    neighbour = np.square(value) + 1.0 if slices > 1 else np.inf
+    zero_dist = np.where(position == target_peak, neighbour, zero_dist)
+    peak_dist = np.square(target_peak - position) + np.square(target_height - value)
+    return np.minimum(zero_dist, peak_dist)
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -6,7 +6,18 @@ Copyright (C) 2018  Radboud universitair medisch centrum
     for full notice, reference readme.md
 """
 # import statements
+import collections
 import itertools
+import numpy as np
+from . import parallel
+from . import timewarp
+
+# maximum number of elements of temporary broadcast arrays in the numpy engine
+BLOCK_ELEMENTS = 2**22
+
+# number of proteins summed at once by the numpy engine. grids are accumulated over
+# protein blocks of this fixed size, so they do not depend on the memory budget
+PROTEIN_BLOCK = 128
 
 def gridprint(grid):
     """prints a grid, for debugging purposes"""
@@ -31,16 +42,24 @@ def distcalc(series1, series2):
         dist += abs(first - second)                                 # calculates absolute distance between corresponding values from 2 lists
     return dist    
 
-def localdist(sample1, sample2):
+def localdist(sample1, sample2, band = None):
     """
     takes protein series data from 2 samples, and returns a 2D list grid with local costs
     
     Keyword arguments:
         sample1/2 -- 2D list structure with all intensity values for each protein at each
                      slice for one sample
+        band -- tuple, first and last column for each row (timewarp.window_band). only
+                grid points within band are computed. None: all grid points
     Returns:
-        localcost -- 2D list grid with local costs between two samples
+        localcost -- 2D list grid with local costs between two samples. with band: list
+                     of local costs of the grid points within band, in band layout
+                     (see timewarp.band_offsets)
     """
+    if band is not None:
+        rows, cols = timewarp.band_cells(band)
+        return [distcalc(sample1[y], sample2[x]) for y, x in zip(rows.tolist(), cols.tolist())]
+
     # initialise grid
     localcost = []
     for column in range(len(sample1)): 
@@ -56,22 +75,507 @@ def localdist(sample1, sample2):
     
     return localcost
 
-def pairwise_localdist(data):
+def array_localdist(sample1, sample2, block_elements = None, band = None):
+    """
+    numpy engine of localdist: computes the local cost grid of two samples with arrays
+
+    the L1 distance between all slice pairs is accumulated over blocks of PROTEIN_BLOCK
+    proteins, by broadcasting blocks of slices of sample1 against blocks of slices of
+    sample2. slice blocks are sized so temporary arrays stay below block_elements
+    elements, bounding peak memory regardless of the number of proteins. the protein
+    blocks, and so the summation order, do not depend on block_elements: grids are
+    identical for every block_elements of at least PROTEIN_BLOCK.
+    Keyword arguments:
+        sample1/2 -- 2D array (or 2D list structure) of shape (slices, proteins) with all
+                     intensity values for each protein at each slice for one sample
+        block_elements -- int, maximum number of elements of temporary arrays
+                          (default: BLOCK_ELEMENTS)
+        band -- tuple, first and last column for each row (timewarp.window_band). only
+                grid points within band are computed (cell_localdist). None: all points
+    Returns:
+        localcost -- 2D np array with local costs between two samples,
+                     shape (slices sample1, slices sample2). with band: 1D np array
+                     with local costs of the grid points within band, in band layout
+                     (see timewarp.band_offsets)
+    """
+    block_elements = block_elements or BLOCK_ELEMENTS
+    sample1 = np.asarray(sample1, dtype = float)
+    sample2 = np.asarray(sample2, dtype = float)
+    if band is not None:
+        rows, cols = timewarp.band_cells(band)
+        return cell_localdist(sample1, sample2, rows, cols, block_elements)
+    len1, len2 = sample1.shape[0], sample2.shape[0]
+    proteins = sample1.shape[1]
+    localcost = np.zeros((len1, len2))
+    columns = max(1, min(proteins, PROTEIN_BLOCK, block_elements))          # proteins per block
+    cols = max(1, min(len2, block_elements // columns))                     # slices of sample2 per block
+    rows = max(1, block_elements // (cols * columns))                       # slices of sample1 per block
+    for first in range(0, proteins, columns):           # protein blocks are added in fixed order
+        for start2 in range(0, len2, cols):
+            block2 = sample2[np.newaxis, start2:start2+cols, first:first+columns]
+            for start in range(0, len1, rows):
+                diff = sample1[start:start+rows, np.newaxis, first:first+columns] - block2
+                localcost[start:start+rows, start2:start2+cols] += np.abs(diff, out = diff).sum(axis = 2)
+    return localcost
+
+def cell_localdist(sample1, sample2, rows, cols, block_elements = None):
+    """
+    computes local costs of selected cells of the local cost grid of two samples
+
+    proteins are summed in the same blocks as array_localdist, so cells are identical to
+    the cells of grids computed by array_localdist.
+    Keyword arguments:
+        sample1/2 -- 2D np array of shape (slices, proteins) for one sample
+        rows/cols -- 1D int np arrays, slice indices in sample1/sample2 of each cell
+        block_elements -- int, maximum number of elements of temporary arrays
+                          (default: BLOCK_ELEMENTS)
+    Returns:
+        1D np array with local cost of each cell
+    """
+    block_elements = block_elements or BLOCK_ELEMENTS
+    proteins = sample1.shape[1]
+    costs = np.zeros(len(rows))
+    columns = max(1, min(proteins, PROTEIN_BLOCK, block_elements))      # proteins per block, as array_localdist
+    cells = max(1, block_elements // columns)                           # cells per block
+    for start in range(0, len(rows), cells):
+        block1, block2 = rows[start:start+cells], cols[start:start+cells]
+        for first in range(0, proteins, columns):
+            diff = sample1[block1, first:first+columns] - sample2[block2, first:first+columns]
+            costs[start:start+cells] += np.abs(diff, out = diff).sum(axis = 1)
+    return costs
+
+def coarsen_sample(sample, factor):
+    """
+    bins slices of sample, averaging intensities of each protein over factor slices
+
+    Keyword arguments:
+        sample -- 2D array (or 2D list structure) of shape (slices, proteins)
+        factor -- int, number of slices per bin. last bin may contain fewer slices
+    Returns:
+        2D np array of shape (ceil(slices/factor), proteins) with binned sample
+    """
+    sample = np.asarray(sample, dtype = float)
+    starts = np.arange(0, sample.shape[0], factor)
+    sizes = np.diff(np.append(starts, sample.shape[0]))
+    return np.add.reduceat(sample, starts, axis = 0) / sizes[:, np.newaxis]
+
+# sparse (slices x proteins) sample in compressed sparse row format: slice i has nonzero
+# values data[indptr[i]:indptr[i+1]] for proteins indices[indptr[i]:indptr[i+1]]
+CSRMatrix = collections.namedtuple('CSRMatrix', ['indptr', 'indices', 'data', 'shape'])
+
+def csr_sample(sample):
+    """
+    converts sample to sparse CSRMatrix, storing only nonzero intensities
+
+    Keyword arguments:
+        sample -- 2D array (or 2D list structure) of shape (slices, proteins)
+    Returns:
+        CSRMatrix of sample, protein indices sorted within each slice
+    """
+    sample = np.asarray(sample, dtype = float)
+    rows, cols = np.nonzero(sample)
+    indptr = np.zeros(sample.shape[0] + 1, dtype = np.int64)
+    np.cumsum(np.count_nonzero(sample, axis = 1), out = indptr[1:])
+    return CSRMatrix(indptr, cols, sample[rows, cols], sample.shape)
+
+def sparse_localdist(sample1, sample2, block_elements = None, band = None):
+    """
+    sparse engine of localdist: computes local cost grid touching only nonzero values
+
+    uses sum|a-b| = sum|a| + sum|b| - sum(|a| + |b| - |a-b|), where the last sum only
+    runs over proteins that are nonzero in both slices. cost scales with the number of
+    protein entries detected in both samples instead of with the total protein number.
+    Keyword arguments:
+        sample1/2 -- CSRMatrix (or dense 2D array) of shape (slices, proteins) for one
+                     sample
+        block_elements -- int, maximum number of matched entries processed at once
+                          (default: BLOCK_ELEMENTS)
+        band -- tuple, first and last column for each row (timewarp.window_band). only
+                grid points within band are accumulated and stored. None: all points
+    Returns:
+        localcost -- 2D np array with local costs between two samples,
+                     shape (slices sample1, slices sample2). with band: 1D np array
+                     with local costs of the grid points within band, in band layout
+                     (see timewarp.band_offsets)
+    """
+    block_elements = block_elements or BLOCK_ELEMENTS
+    if not isinstance(sample1, CSRMatrix):
+        sample1 = csr_sample(sample1)
+    if not isinstance(sample2, CSRMatrix):
+        sample2 = csr_sample(sample2)
+    len1, len2 = sample1.shape[0], sample2.shape[0]
+
+    # slice of each nonzero entry, entries of both samples reordered by protein
+    rows1 = np.repeat(np.arange(len1), np.diff(sample1.indptr))
+    rows2 = np.repeat(np.arange(len2), np.diff(sample2.indptr))
+    order1 = np.argsort(sample1.indices, kind = 'stable')
+    order2 = np.argsort(sample2.indices, kind = 'stable')
+    proteins1, rows1, values1 = sample1.indices[order1], rows1[order1], sample1.data[order1]
+    proteins2, rows2, values2 = sample2.indices[order2], rows2[order2], sample2.data[order2]
+    norms1 = np.bincount(rows1, weights = np.abs(values1), minlength = len1)
+    norms2 = np.bincount(rows2, weights = np.abs(values2), minlength = len2)
+
+    # for each sample1 entry: the range of sample2 entries of the same protein
+    starts = np.searchsorted(proteins2, proteins1, side = 'left')
+    counts = np.searchsorted(proteins2, proteins1, side = 'right') - starts
+    if band is None:
+        band = timewarp.window_band(len1, len2)
+        dense = True
+    else:
+        dense = False
+    starts_band = timewarp.band_offsets(band)
+    overlap = np.zeros(starts_band[-1] + band[1][-1] - band[0][-1] + 1)
+    ends = np.cumsum(counts)
+    first = 0
+    while first < len(counts):          # blocks of sample1 entries, at most block_elements matches each
+        last = max(first + 1, np.searchsorted(ends, ends[first] - counts[first] + block_elements, side = 'right'))
+        block_counts = counts[first:last]
+        entries1 = np.repeat(np.arange(first, last), block_counts)
+        within = np.arange(len(entries1)) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+        entries2 = np.repeat(starts[first:last], block_counts) + within
+        first_values, second_values = values1[entries1], values2[entries2]
+        matched = np.abs(first_values) + np.abs(second_values) - np.abs(first_values - second_values)
+        inband, cells = timewarp.band_positions(band, starts_band, rows1[entries1], rows2[entries2])
+        overlap += np.bincount(cells[inband], weights = matched[inband], minlength = len(overlap))
+        first = last
+    if dense:
+        localcost = norms1[:, np.newaxis] + norms2[np.newaxis, :] - overlap.reshape(len1, len2)
+    else:
+        rows, cols = timewarp.band_cells(band)
+        localcost = norms1[rows] + norms2[cols] - overlap
+    return np.maximum(localcost, 0)     # clip rounding errors below 0
+
+class LocalDistStore(object):
+    """
+    stores local distance grids of all sample pairs in one contiguous buffer
+
+    only grids of pairs of different samples are stored, packed in upper triangular pair
+    order: (0,1), (0,2) .. (0,n-1), (1,2) .. (n-2,n-1), or only those of selected pairs,
+    in the order they are given. grids are accessed with integer
+    sample indices (starting at 0) in any order: grid(j,i) is the transposed grid(i,j).
+    with a warping window only the grid cells within the window band of each pair
+    (timewarp.window_band) are stored, row by row (band layout, see
+    timewarp.band_offsets), so memory scales with the window width.
+    grid cells that have not been computed are NaN. if the samples are stored with the
+    grids, values() computes these cells when they are first needed. cells outside the
+    window band are computed each time they are needed, they are not stored.
+    copies of the store in worker processes can record the cells they compute (record,
+    recorded_cells), to store them in the original store (add_cells).
+    """
+    def __init__(self, samplelengths, dtype = np.float64, samples = None, block_elements = None,
+                 window = None, pairs = None):
+        """
+        Args:
+            samplelengths: list of ints, number of slices of each sample
+            dtype: float type of the grid buffer (np.float64 or np.float32)
+            samples: list of 2D np arrays (slices, proteins), sample data used to compute
+                     missing grid cells
+            block_elements: int, maximum number of elements of temporary arrays when
+                            computing missing cells
+            window: int (slices) or float < 1 (fraction of longest sample), warping
+                    window of stored grid cells. None: full grids
+            pairs: list of sample pairs (i,j) with i < j of which grids are stored.
+                   None: all pairs
+        """
+        self.samplelengths = list(samplelengths)
+        self.samplenum = len(self.samplelengths)
+        self.dtype = np.dtype(dtype)
+        self.samples = samples
+        self.block_elements = block_elements
+        self.window = window
+        if pairs is None:
+            pairs = itertools.combinations(range(self.samplenum), 2)
+        self.storedpairs = [(int(i), int(j)) for i, j in pairs]
+        self.pairindices = dict((pair, k) for k, pair in enumerate(self.storedpairs))
+        self.bands = [timewarp.window_band(self.samplelengths[i], self.samplelengths[j], window)
+                      for i, j in self.pairs()]
+        self.starts = [timewarp.band_offsets(band) for band in self.bands]
+        sizes = [int(starts[-1] + band[1][-1] - band[0][-1] + 1) if len(starts) else 0
+                 for starts, band in zip(self.starts, self.bands)]
+        self.offsets = np.concatenate(([0], np.cumsum(sizes, dtype = np.int64)))
+        self.buffer = np.full(self.offsets[-1], np.nan, dtype = self.dtype)
+        self.recorded = None
+
+    def pairs(self):
+        """returns list of stored sample pairs (i,j) with i < j, in pair index order"""
+        return list(self.storedpairs)
+
+    def pair_index(self, i, j):
+        """returns position of pair i,j (i != j, any order) in packed pair order"""
+        if i == j:
+            raise ValueError('no local distance grid stored for self pair: {}'.format(i))
+        if i > j:
+            i, j = j, i
+        if (i, j) not in self.pairindices:
+            raise ValueError('no local distance grid stored for pair: {}, {}'.format(i, j))
+        return self.pairindices[(i, j)]
+
+    def cells(self, i, j):
+        """
+        returns stored grid cells of samples i and j (i < j)
+
+        Returns:
+            cells: 1D np array view on buffer, grid cells in band layout of the pair
+            band (tuple): band of stored cells, as returned by timewarp.window_band
+            starts: int np array, position of the first cell of each row in cells
+        """
+        k = self.pair_index(i, j)
+        return self.buffer[self.offsets[k]:self.offsets[k+1]], self.bands[k], self.starts[k]
+
+    def grid(self, i, j):
+        """
+        returns local distance grid between samples i and j
+
+        Args:
+            i/j (int): sample indices, starting at 0
+        Returns:
+            grid: 2D np array, shape (length of i, length of j). without window a view on
+                  buffer, with window a copy with NaN outside the window band
+        """
+        low, high = min(i, j), max(i, j)
+        cells, band, starts = self.cells(low, high)
+        if self.window is None:
+            grid = cells.reshape(self.samplelengths[low], self.samplelengths[high])
+        else:
+            grid = np.full((self.samplelengths[low], self.samplelengths[high]), np.nan, dtype = self.dtype)
+            grid[timewarp.band_cells(band)] = cells
+        if i > j:
+            return grid.T
+        return grid
+
+    def set_grid(self, i, j, grid):
+        """
+        stores local distance grid between samples i and j
+
+        Args:
+            i/j (int): sample indices, starting at 0
+            grid: 2D np array of shape (length of i, length of j), or 1D np array with
+                  the cells within the window band in band layout (i < j only)
+        """
+        grid = np.asarray(grid)
+        cells, band, starts = self.cells(min(i, j), max(i, j))
+        if grid.ndim == 1:
+            if i > j:
+                raise ValueError('grid cells in band layout are stored for i < j: {}, {}'.format(i, j))
+            cells[...] = grid
+            return
+        if i > j:
+            grid = grid.T
+        if self.window is None:
+            cells[...] = grid.ravel()
+        else:
+            cells[...] = grid[timewarp.band_cells(band)]
+
+    def values(self, i, j, rows, cols):
+        """
+        returns local distances between samples i and j at given slice index pairs
+
+        cells that have not been computed yet are computed from the stored samples and
+        kept in the grid (if within the window band).
+        Args:
+            i/j (int): sample indices, starting at 0
+            rows/cols: int np arrays (broadcastable), slice indices in sample i / j
+        Returns:
+            np array of local distances, shape of broadcast rows and cols
+        """
+        if i > j:
+            return self.values(j, i, cols, rows)
+        cells, band, starts = self.cells(i, j)
+        if self.window is None:         # full grid: all cells are in band
+            values = self.grid(i, j)[rows, cols]
+        else:
+            inband, positions = timewarp.band_positions(band, starts, rows, cols)
+            values = np.where(inband, cells[positions], np.nan).astype(self.dtype, copy = False)
+        missing = np.isnan(values)
+        if missing.any():
+            if self.samples is None:
+                raise ValueError('local distances missing for samples {} and {}'.format(i, j))
+            rows, cols = np.broadcast_arrays(rows, cols)
+            width = self.samplelengths[j]
+            cellids, inverse = np.unique(rows[missing] * width + cols[missing], return_inverse = True)
+            missing_rows, missing_cols = np.divmod(cellids, width)
+            costs = cell_localdist(self.samples[i], self.samples[j], missing_rows, missing_cols,
+                                   self.block_elements).astype(self.dtype)
+            keep, cellpositions = timewarp.band_positions(band, starts, missing_rows, missing_cols)
+            cells[cellpositions[keep]] = costs[keep]
+            if self.recorded is not None:
+                self.recorded.append((self.offsets[self.pair_index(i, j)] + cellpositions[keep], costs[keep]))
+            values[missing] = costs[inverse.ravel()]
+        return values
+
+    def record(self):
+        """starts recording the grid cells computed by values(), see recorded_cells"""
+        self.recorded = []
+
+    def recorded_cells(self):
+        """
+        returns the grid cells computed since record() was called, and stops recording
+
+        Returns:
+            cells (tuple): buffer positions (int np array) and values (np array)
+        """
+        recorded, self.recorded = self.recorded or [], None
+        if not recorded:
+            return (np.zeros(0, dtype = np.int64), np.zeros(0, dtype = self.dtype))
+        return (np.concatenate([positions for positions, values in recorded]),
+                np.concatenate([values for positions, values in recorded]))
+
+    def add_cells(self, cells):
+        """stores grid cells recorded by a copy of this store, see recorded_cells"""
+        positions, values = cells
+        self.buffer[positions] = values
+
+def memory_elements(max_memory):
+    """converts memory budget in MB to number of float64 array elements (None if None)"""
+    if max_memory is None:
+        return None
+    elements = int(max_memory * 2**20) // np.dtype(np.float64).itemsize
+    if elements < 1:
+        raise ValueError('local distance memory budget too small: {} MB'.format(max_memory))
+    return elements
+
+# local distance engines selectable in pairwise_localdist
+ENGINES = {'reference': localdist, 'numpy': array_localdist, 'sparse': sparse_localdist}
+
+def pair_localdist(pair):
+    """
+    computes local cost grid for one sample pair, using data shared by parallel_map
+
+    Keyword argument:
+        pair -- tuple of 2 ints, sample indices of the pair (starting at 0)
+    Returns:
+        local cost grid of sample pair, computed with engine in parallel.shared. with a
+        window only the cells within the window band, in band layout
+    """
+    data = parallel.shared['data']
+    engine = parallel.shared['engine']
+    window = parallel.shared['window']
+    samplelengths = parallel.shared['samplelengths']
+    band = None
+    if window is not None:
+        band = timewarp.window_band(samplelengths[pair[0]], samplelengths[pair[1]], window)
+    if engine == 'reference':
+        return localdist(data[pair[0]], data[pair[1]], band)
+    return ENGINES[engine](data[pair[0]], data[pair[1]], parallel.shared['block_elements'], band)
+
+def pairwise_localdist(data, engine = 'reference', n_jobs = 1, dtype = np.float64,
+                       max_memory = None, window = None, lazy = False):
     """
     takes complexome profile data of all samples, creates local cost grids for each pair
-    
+
+    self pairs are skipped, as samples are never aligned to themselves
     Keyword argument:
         data -- 3D list structure with complexome profile data for all samples
+        engine -- string, local distance engine to use:
+                - 'reference': pure python implementation
+                - 'numpy': vectorised implementation
+                - 'sparse': vectorised implementation on sparse samples, only touching
+                            nonzero intensities
+        n_jobs -- int, number of worker processes computing grids in parallel
+                  (1: no parallelism, -1: all cpus)
+        dtype -- float type in which grids are stored (np.float64 or np.float32)
+        max_memory -- number, memory budget in MB for temporary arrays of the numpy and
+                      sparse engines, per worker process. grids are accumulated over
+                      blocks of proteins to stay within budget (default: BLOCK_ELEMENTS).
+                      the samples themselves (converted to float arrays once, and kept
+                      by the store without copying) and the stored grids are not part of
+                      the budget
+        window -- int (slices) or float < 1 (fraction of longest sample), warping window
+                  width. all engines only compute and store the grid cells within the
+                  window, other cells are computed when needed. None: no window
+        lazy -- bool, if True no grid cells are computed beforehand, all cells are
+                computed when first needed
+    Returns:
+        localdict -- LocalDistStore with local distance grid for each sample pair
+    """
+    if engine not in ENGINES:
+        raise ValueError('local distance engine not recognized!: {}'.format(engine))
+    samples = [np.asarray(sample, dtype = float) for sample in data]   # convert samples once, not per pair
+    block_elements = memory_elements(max_memory)
+    localdict = LocalDistStore([len(sample) for sample in samples], dtype = dtype,
+                               samples = samples, block_elements = block_elements, window = window)
+    if lazy:
+        return localdict
+    fill_grids(localdict, localdict.pairs(), engine, n_jobs)
+    return localdict
+
+def fill_grids(localdict, pairs, engine = 'reference', n_jobs = 1):
+    """
+    computes local cost grids of sample pairs from the samples stored in localdict
+
+    Keyword argument:
+        localdict -- LocalDistStore holding samples, grids are stored in it
+        pairs -- list of tuples (i,j), i < j, sample indices (starting at 0) of pairs to
+                 compute
+        engine, n_jobs -- see pairwise_localdist
+    Returns:
+        None
+    """
+    samples = localdict.samples
+    if engine == 'numpy':
+        data = samples
+    elif engine == 'sparse':
+        data = [csr_sample(sample) for sample in samples]
+    else:
+        data = [sample.tolist() for sample in samples]
+    grids = parallel.parallel_map(pair_localdist, pairs, n_jobs,
+                                  shared_data = {'data': data, 'engine': engine, 'window': localdict.window,
+                                                 'samplelengths': localdict.samplelengths,
+                                                 'block_elements': localdict.block_elements})
+    for pair, grid in zip(pairs, grids):
+        localdict.set_grid(pair[0], pair[1], grid)
+
+def extend_store(localdict, data, engine = 'reference', n_jobs = 1, dtype = np.float64,
+                 max_memory = None, window = None):
+    """
+    creates local cost grids for samples added to the samples of an existing store
+
+    grids of pairs of the existing samples stored in localdict are copied, only grids of
+    pairs with new samples are computed. a store without pairs (pairs = []) adds only
+    the grids of pairs with new samples, which is all that is needed to add samples.
+    Keyword argument:
+        localdict -- LocalDistStore of the existing samples, for example from load_store
+        data -- 3D list structure with complexome profile data for all samples, starting
+                with the samples of localdict
+        engine, n_jobs, dtype, max_memory, window -- see pairwise_localdist
     Returns:
-        localdict -- dictionary with local distance grid for each sample pair
-                   - keys 'samplenum:samplenum'  (ie: '1:2')
-                   - values 2D list structure
-    """
-    localdict = {}
-    samples = list(range(1,len(data)+1))             # the samples the main loop iterates through
-    targets = list(range(1,len(data)+1))             # the target samples that get aligned with samples
-    for sample in samples:                     #loops through each sample
-        for target in targets:                 # per sample, loops through all targets
-            localdict[str(sample) + ":" + str(target)] = localdist(data[sample-1], data[target-1])
-        del targets[0]                         # removes first target after it has been aligned with all samples already
-    return localdict    
+        localdict -- LocalDistStore with local distance grid for each sample pair
+    """
+    if engine not in ENGINES:
+        raise ValueError('local distance engine not recognized!: {}'.format(engine))
+    samples = [np.asarray(sample, dtype = float) for sample in data]
+    if [len(sample) for sample in samples[:localdict.samplenum]] != localdict.samplelengths:
+        raise ValueError('first samples of data do not match samples of local distance store')
+    allpairs = list(itertools.combinations(range(len(samples)), 2))
+    newpairs = [(i, j) for i, j in allpairs if j >= localdict.samplenum]
+    oldpairs = set(localdict.pairs())
+    pairs = [(i, j) for i, j in allpairs if (i, j) in oldpairs or j >= localdict.samplenum]
+    extended = LocalDistStore([len(sample) for sample in samples], dtype = dtype, samples = samples,
+                              block_elements = memory_elements(max_memory), window = window, pairs = pairs)
+    for i, j in localdict.pairs():
+        if localdict.window == window:        # same cells, copy them directly
+            extended.set_grid(i, j, localdict.cells(i, j)[0])
+        else:
+            extended.set_grid(i, j, localdict.grid(i, j))
+    fill_grids(extended, newpairs, engine, n_jobs)
+    return extended
+
+def save_store(filename, localdict):
+    """saves local distance grids of LocalDistStore in a compressed .npz file"""
+    arrays = {'buffer': localdict.buffer,
+              'samplelengths': np.asarray(localdict.samplelengths, dtype = np.int64)}
+    if localdict.window is not None:
+        arrays['window'] = np.asarray(localdict.window)
+    if len(localdict.storedpairs) != localdict.samplenum * (localdict.samplenum - 1) // 2:
+        arrays['pairs'] = np.asarray(localdict.storedpairs, dtype = np.int64).reshape(-1, 2)
+    np.savez_compressed(filename, **arrays)
+
+def load_store(filename):
+    """loads LocalDistStore saved with save_store (without samples)"""
+    with np.load(filename, allow_pickle = False) as arrays:
+        window = arrays['window'].item() if 'window' in arrays.files else None
+        pairs = arrays['pairs'].tolist() if 'pairs' in arrays.files else None
+        localdict = LocalDistStore(arrays['samplelengths'].tolist(), dtype = arrays['buffer'].dtype,
+                                   window = window, pairs = pairs)
+        localdict.buffer[...] = arrays['buffer']
+    return localdict
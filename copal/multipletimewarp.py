@@ -8,6 +8,8 @@ Copyright (C) 2018  Radboud universitair medisch centrum
 
 # import statements
 from . import timewarp
+from . import localdist
+from . import parallel
 import numpy as np
 
 # functions
@@ -27,55 +29,174 @@ def create_sample_entries(totaldata,samplelengths):
         entries[str(sample+1)] = {str(sample+1):range(samplelengths[sample])}
     return entries
 
-def pairwise_timewarp(totaldata,samplelengths,localdict):
+def shared_stores(settings):
+    """returns the local distance stores of shared settings: localdict and coarse localdict"""
+    if settings['coarse'] is None:
+        return [settings['localdict']]
+    return [settings['localdict'], settings['coarse'][0]]
+
+def record_cells(settings):
+    """starts recording grid cells computed in the shared local distance stores"""
+    for store in shared_stores(settings):
+        store.record()
+
+def recorded_cells(settings):
+    """returns the grid cells computed in each shared local distance store since record_cells"""
+    return [store.recorded_cells() for store in shared_stores(settings)]
+
+def store_cells(settings, results):
+    """
+    stores grid cells computed by workers in the local distance stores of this process
+
+    lazily computed grid cells are otherwise lost with the store copies of the workers.
+    Args:
+        settings (dict): shared data the workers used
+        results (list): (result, recorded cells) of each worker call
+    Returns:
+        results (list): results without recorded cells
+    """
+    stores = shared_stores(settings)
+    for result, cells in results:
+        for store, storecells in zip(stores, cells):
+            store.add_cells(storecells)
+    return [result for result, cells in results]
+
+def pair_timewarp(pair):
+    """
+    performs pairwise alignment of one sample pair, using data shared by parallel_map
+
+    Args:
+        pair (tuple): sample numbers (str) of the pair
+    Returns:
+        (alignment (dict), cost) if parallel.shared['keep_alignments'], otherwise cost,
+        and grid cells computed in the shared stores (see recorded_cells)
+    """
+    settings = parallel.shared
+    entries = settings['entries']
+    record_cells(settings)
+    if settings['keep_alignments']:
+        result = timewarp.timewarp(settings['localdict'], entries[pair[0]], entries[pair[1]],
+                                   settings['window'], settings['coarse'])
+    else:
+        result = timewarp.timewarp_cost(settings['localdict'], entries[pair[0]], entries[pair[1]],
+                                        settings['window'], settings['coarse'])
+    return (result, recorded_cells(settings))
+
+def pairwise_timewarp(totaldata,samplelengths,localdict,window = None,coarse = None,
+                      keep_alignments = False, n_jobs = 1):
     """
     performs pairwise alignments (first step of progressive alignment)
 
+    by default only alignment costs are determined, which are needed for the alignment
+    order. multiple_timewarp performs the pairwise alignments it actually uses itself.
+
     Args:
         totaldata: 3D list structure with complexome profile sample intensity values
         samplelengths: list of ints, length of each sample
-        localdict: dict with 2D local cost value grid for each sample pair
+        localdict: LocalDistStore with 2D local cost value grid for each sample pair
+        window: int (slices) or float < 1 (fraction of longest sample), warping window
+                width. None: no window
+        coarse (tuple): (coarse_localdict, factor, radius) for approximate timewarping,
+                        see timewarp.approximate_band. None: exact timewarping
+        keep_alignments (bool): if True, also perform and return all pairwise alignments
+        n_jobs (int): number of worker processes aligning pairs in parallel
+                      (1: no parallelism, -1: all cpus)
     Returns:
         pairwisedict (dict): dictionary with alignments results for each pair
                             pair entry: {'samplenum:samplenum'(str): alignment(dict)}
-        pairwisecosts: (dict): keys -> alignment costs, values -> 'sample1:sample2' pairs
+                            empty unless keep_alignments
+        costmatrix (ndarray): symmetric (samples x samples) matrix with pairwise alignment
+                              costs, row/column i belongs to sample i+1 (see cost_pairs)
     """
     entries = create_sample_entries(totaldata,samplelengths)
+    rows, cols = np.triu_indices(len(entries), 1)   # all pairs, without self-matches
+    pairs = [(str(row+1), str(col+1)) for row, col in zip(rows, cols)]
+    shared_data = {'localdict': localdict, 'entries': entries, 'window': window,
+                   'coarse': coarse, 'keep_alignments': keep_alignments}
+    results = store_cells(shared_data, parallel.parallel_map(pair_timewarp, pairs, n_jobs, shared_data))
+
     pairwisedict = {}
-    pairwisecosts = {}
-    samples = sorted(entries.keys())[:-1]
-    targets = sorted(entries.keys())[1:]
-    for sample in samples: # loop that goes over all pairs, without including self-matches
-        for target in targets:
-            pairwarp = timewarp.timewarp(localdict,entries[sample], entries[target])
-            pairwisedict[sample + ':' + target] =  pairwarp[0]
-            pairwisecosts[pairwarp[1]] = sample + ':' + target
-        del targets[0]
-    return (pairwisedict,pairwisecosts)
-
-def multiple_timewarp(pairwisecosts,samplelengths,localdict,pairwisedict):
+    if keep_alignments:
+        for pair, result in zip(pairs, results):   # results are in pair order, independent of workers
+            pairwisedict[pair[0] + ':' + pair[1]] = result[0]
+        results = [result[1] for result in results]
+    costmatrix = np.zeros((len(entries), len(entries)))
+    costmatrix[rows, cols] = results
+    costmatrix[cols, rows] = results
+    return (pairwisedict,costmatrix)
+
+def intensity_traces(totaldata):
+    """returns total intensity of each slice (1D np array) for each sample"""
+    return [np.asarray(sample, dtype = float).sum(axis = 1) for sample in totaldata]
+
+def trace_costmatrix(totaldata, window = None):
+    """
+    determines cheap pairwise sample distances, to build a guide tree without timewarping
+    all sample pairs
+
+    samples are summarised as total intensity traces, which are timewarped instead of
+    the full samples: local distances are absolute differences of slice totals.
+    Args:
+        totaldata: 3D list structure with complexome profile sample intensity values
+        window: int (slices) or float < 1 (fraction of longest sample), warping window
+                width. None: no window
+    Returns:
+        costmatrix (ndarray): symmetric (samples x samples) matrix with trace alignment
+                              costs, row/column i belongs to sample i+1
+    """
+    traces = intensity_traces(totaldata)
+    costmatrix = np.zeros((len(traces), len(traces)))
+    for sample1, sample2 in zip(*np.triu_indices(len(traces), 1)):
+        trace1, trace2 = traces[sample1], traces[sample2]
+        band = timewarp.window_band(len(trace1), len(trace2), window)
+        rows, cols = timewarp.band_cells(band)
+        localcost = np.abs(trace1[rows] - trace2[cols])         # band layout
+        costmatrix[sample1, sample2] = costmatrix[sample2, sample1] = timewarp.dtw_cost(localcost, band)
+    return costmatrix
+
+def cost_pairs(costmatrix):
+    """
+    orders all sample pairs from lowest to highest pairwise alignment cost
+
+    pairs with equal costs keep their (row, column) order.
+    Args:
+        costmatrix (ndarray): pairwise cost matrix, see pairwise_timewarp
+    Returns:
+        pairs (list of tuples): (cost (float), sample1 (int), sample2 (int)), sample
+                                numbers start at 1 and sample1 < sample2
+    """
+    rows, cols = np.triu_indices(len(costmatrix), 1)
+    costs = costmatrix[rows, cols]
+    order = np.argsort(costs, kind = 'stable')
+    return list(zip(costs[order].tolist(), (rows[order]+1).tolist(), (cols[order]+1).tolist()))
+
+def multiple_timewarp(costmatrix,samplelengths,localdict,pairwisedict,window = None,coarse = None):
     """
     determines progressive aligment order and performs progressive alignment
 
     Args:
-        pairwisecosts (dict): pairwise alignment costs(keys), sample pairs (values)
+        costmatrix (ndarray): pairwise alignment cost matrix, see pairwise_timewarp
         samplelengths: list of ints, length of each sample
-        localdict: dict with 2D local cost value grid for each sample pair
+        localdict: LocalDistStore with 2D local cost value grid for each sample pair
         pairwisedict (dict): dictionary with alignments results for each pair
                             pair entry: {'samplenum:samplenum'(str): alignment(dict)}
+                            pairwise alignments missing from it are performed when used
+        window: int (slices) or float < 1 (fraction of longest alignment), warping
+                window width. None: no window
+        coarse (tuple): (coarse_localdict, factor, radius) for approximate timewarping,
+                        see timewarp.approximate_band. None: exact timewarping
     Returns:
         final alignment(dict): samples as keys (int), aligned slice indices values (list)
             multiple_alignment_order (listof tuples): multiple alignment order
                                       format:[((align1 samples),(align2 samples), cost)]
     """
     #sort pairwise alignments from pairs with lowest cost to pairs with highest cost
-    keys = sorted(pairwisecosts.keys())
     msa_order = []                      # list with alignments have been performed with[(al1,al2,cost), ...]
     alignments = {}
-    for key in keys:                    # loop through pairwise alignments. pair value looks like: '1:2'
+    for key, sample1, sample2 in cost_pairs(costmatrix):   # loop through pairwise alignments
 
     #determine for each pair in sorted list if the 2 samples have already been aligned, either seperately or in the same alignment
-        pair = pairwisecosts[key]
+        pair = '{}:{}'.format(sample1, sample2)          # pair looks like: '1:2'
         sample_in_alignments = []       # shows for both samples in pair whether and if so, in which alignment it is using None/slicenr of alignments list
         for sample in [0,1]:            # loops through 2 samples in each pair
             sample_loc = None
@@ -86,7 +207,13 @@ def multiple_timewarp(pairwisecosts,samplelengths,localdict,pairwisedict):
 
     #perform time warping alignment for all possible scenarios of each pair
         if sample_in_alignments[0] == None and sample_in_alignments[1] == None:  # both samples haven't been aligned --> take pairwise alignment
-            alignments[(int(pair.split(':')[0]),int(pair.split(':')[1]))] = pairwisedict[pair]       # get alignment from pairwisedict, store in alignments
+            if pair in pairwisedict:           # get alignment from pairwisedict, or perform it now
+                pair_align = pairwisedict[pair]
+            else:
+                sample1, sample2 = pair.split(':')
+                pair_align = timewarp.timewarp(localdict, {sample1: range(samplelengths[int(sample1)-1])},
+                                               {sample2: range(samplelengths[int(sample2)-1])}, window, coarse)[0]
+            alignments[(int(pair.split(':')[0]),int(pair.split(':')[1]))] = pair_align       # store in alignments
             msa_order.append(((int(pair.split(':')[0])),(int(pair.split(':')[1])), key))                 # add alignment info to msa_order
 
         elif sample_in_alignments[0] == sample_in_alignments[1]:           # samples already in same alignment --> skip this pair
@@ -96,7 +223,7 @@ def multiple_timewarp(pairwisecosts,samplelengths,localdict,pairwisedict):
             align1key = sample_in_alignments[0]                   # get keys from the 2 alignments
             align2key = sample_in_alignments[1]
             new_key = tuple(list(align1key)+list(align2key))                         # create new key by combining old ones
-            alignments[new_key] = timewarp.timewarp(localdict,alignments[align1key], alignments[align2key])[0]   # perform alignment, store in alignments
+            alignments[new_key] = timewarp.timewarp(localdict,alignments[align1key], alignments[align2key], window, coarse)[0]   # perform alignment, store in alignments
             msa_order.append((align1key,align2key, key))
             del alignments[align1key]                               # delete old alignments
             del alignments[align2key]
@@ -105,125 +232,492 @@ def multiple_timewarp(pairwisecosts,samplelengths,localdict,pairwisedict):
             new_align = {pair.split(':')[0]:range(samplelengths[int(pair.split(':')[0])-1])}       # create new entry for unaligned sample
             align2key = sample_in_alignments[1]        # get key for 2's alignment
             new_key = tuple(list(align2key) + [int(pair.split(':')[0])])             # generate new key by adding sample 1
-            alignments[new_key] = timewarp.timewarp(localdict,new_align,alignments[align2key])[0]
-            msa_order.append(((int(pair[0])), align2key, key))
+            alignments[new_key] = timewarp.timewarp(localdict,new_align,alignments[align2key],window,coarse)[0]
+            msa_order.append(((int(pair.split(':')[0])), align2key, key))
             del alignments[align2key]
 
         elif sample_in_alignments[1] == None:                             # sample 2 not yet aligned, 1 has been --> align 2 with 1's alignment
             new_align = {pair.split(':')[1]:range(samplelengths[int(pair.split(':')[1])-1])}
             align1key = sample_in_alignments[0]
             new_key = tuple(list(align1key) + [int(pair.split(':')[1])])
-            alignments[new_key]= timewarp.timewarp(localdict,new_align,alignments[align1key])[0]
+            alignments[new_key]= timewarp.timewarp(localdict,new_align,alignments[align1key],window,coarse)[0]
             msa_order.append((align1key, (int(pair.split(':')[1])), key))
             del alignments[align1key]
 
     return (next(iter(alignments.values())), msa_order)
 
+def tree_samples(tree):
+    """returns set of sample numbers (int) at the leaves of a guide tree (node)"""
+    if isinstance(tree, tuple):
+        return tree_samples(tree[0]) | tree_samples(tree[1])
+    return {tree}
+
+def guide_tree(costmatrix, linkage = 'single'):
+    """
+    builds guide tree for progressive alignment from pairwise alignment costs
+
+    leaves are sample numbers (int), internal nodes are (left, right, cost) tuples.
+    single linkage merges in the same order, with the same orientation, as
+    multiple_timewarp. average linkage (UPGMA) merges the two clusters with the lowest
+    mean pairwise cost, with the cluster containing the lowest sample number on the left.
+    Args:
+        costmatrix (ndarray): pairwise alignment cost matrix, see pairwise_timewarp
+        linkage (str): 'single' or 'average'
+    Returns:
+        tree: root node of guide tree, nested (left, right, cost) tuples
+    """
+    if linkage == 'single':
+        clusters = {}                   # sample -> node of the cluster it is in
+        tree = 1 if len(costmatrix) == 1 else None
+        for cost, sample1, sample2 in cost_pairs(costmatrix):
+            node1 = clusters.get(sample1, sample1)
+            node2 = clusters.get(sample2, sample2)
+            if node1 == node2:          # already in same cluster
+                continue
+            tree = (node1, node2, cost)
+            for sample in tree_samples(tree):
+                clusters[sample] = tree
+        return tree
+    if linkage == 'average':
+        clusters = list(range(1, len(costmatrix)+1))
+        members = {sample: [sample-1] for sample in clusters}  # matrix indices of cluster members
+        while len(clusters) > 1:
+            best = None
+            for index1 in range(len(clusters)):
+                for index2 in range(index1+1, len(clusters)):
+                    samples1 = members[clusters[index1]]
+                    samples2 = members[clusters[index2]]
+                    cost = float(costmatrix[np.ix_(samples1, samples2)].mean())
+                    if best == None or cost < best[0]:
+                        best = (cost, index1, index2)
+            cost, index1, index2 = best
+            node = (clusters[index1], clusters[index2], cost)
+            members[node] = members[clusters[index1]] + members[clusters[index2]]
+            clusters = [cluster for index, cluster in enumerate(clusters)
+                        if index not in (index1, index2)] + [node]
+            clusters.sort(key = lambda cluster: min(members[cluster]))
+        return clusters[0] if clusters else None
+    raise ValueError("unknown linkage: {}, use 'single' or 'average'".format(linkage))
+
+def tree_levels(tree):
+    """
+    groups internal nodes of guide tree by height, nodes at one height are independent
+
+    Returns:
+        levels (list): list of lists of nodes, lowest merges first
+    """
+    levels = []
+    def height(node):
+        if not isinstance(node, tuple):
+            return -1
+        level = max(height(node[0]), height(node[1])) + 1
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(node)
+        return level
+    height(tree)
+    return levels
+
+def consensus_profile(samples, alignment):
+    """
+    summarises an alignment as the mean of its warped member samples
+
+    Args:
+        samples: list of 2D np arrays (slices, proteins), data of all samples
+        alignment (dict): samples as keys (str), aligned slice indices as values (list)
+    Returns:
+        profile: 2D np array (aligned slices, proteins)
+    """
+    return np.mean([samples[int(key)-1][np.asarray(indices)] for key, indices in alignment.items()], axis = 0)
+
+def profile_band(profile1, profile2, window = None, coarse = None, block_elements = None):
+    """
+    determines the band of grid points to compute when timewarping consensus profiles
+
+    with coarse, the profiles are warped at the resolution of slice bins first (see
+    timewarp.approximate_band), using the distances of the binned profiles instead of
+    the stored distances of all sample pairs of the alignments.
+    Args:
+        profile1/2: 2D np arrays (aligned slices, proteins), consensus profiles
+        window: int (slices) or float < 1 (fraction of longest alignment), warping
+                window. None: no window
+        coarse (tuple): (coarse_localdict, factor, radius) for approximate timewarping,
+                        only factor and radius are used. None: exact timewarping
+        block_elements (int): memory budget of local distance computation, see
+                              localdist.array_localdist
+    Returns:
+        band (tuple): first and last column for each row. None: all grid points
+    """
+    if coarse is None:
+        if window is None:
+            return None
+        return timewarp.window_band(len(profile1), len(profile2), window)
+    coarse_localdict, factor, radius = coarse
+    coarse1 = localdist.coarsen_sample(profile1, factor)
+    coarse2 = localdist.coarsen_sample(profile2, factor)
+    coarse_band = timewarp.coarse_window_band(len(coarse1), len(coarse2), factor, window)
+    localcost = localdist.array_localdist(coarse1, coarse2, block_elements, coarse_band)
+    path = timewarp.backtrace(timewarp.dtw(localcost, coarse_band)[1], coarse_band)
+    return timewarp.projected_band(path, len(profile1), len(profile2), factor, radius, window)
+
+def profile_timewarp(profile1, profile2, align1, align2, window = None, coarse = None,
+                     block_elements = None):
+    """
+    performs timewarping between two alignments, using their consensus profiles
+
+    local costs are the distances between the two profiles, so only one local distance
+    grid is computed, independent of the number of samples in the alignments.
+    Args:
+        profile1/2: 2D np arrays (aligned slices, proteins), consensus profiles of the
+                    alignments, see consensus_profile
+        align1/2 (dict): input alignments samples as keys (str), aligned slice indices as
+                         values (list)
+        window: int (slices) or float < 1 (fraction of longest alignment), warping
+                window. None: no window
+        coarse (tuple): (coarse_localdict, factor, radius) for approximate timewarping,
+                        see profile_band. None: exact timewarping
+        block_elements (int): memory budget of local distance computation, see
+                              localdist.array_localdist
+    Returns:
+        new_align: resulting alignment, samples as keys (str), aligned slice indices
+                    as values (list)
+        alignment_cost: global cost of alignment
+        profile: consensus profile of resulting alignment
+    """
+    band = profile_band(profile1, profile2, window, coarse, block_elements)
+    localcost = localdist.array_localdist(profile1, profile2, block_elements, band)
+    distcost, arrows = timewarp.dtw(localcost, band)
+    alignment = timewarp.backtrace(arrows, band)
+    new_align = timewarp.warp_alignments(align1, align2, alignment)
+    rows, cols = np.array(alignment).T
+    # mean of the members of both alignments, warped along the new alignment
+    profile = (len(align1)*profile1[rows] + len(align2)*profile2[cols]) / (len(align1) + len(align2))
+    return (new_align, float(distcost.flat[-1]), profile)
+
+def merge_timewarp(job):
+    """
+    aligns two alignments, using data shared by parallel_map
+
+    Args:
+        job (tuple): (align1, align2, profile1, profile2). without profiles local
+                     distances are averaged over all sample pairs of the alignments
+    Returns:
+        alignment (dict), consensus profile (None unless parallel.shared['samples']), and
+        grid cells computed in the shared stores (see recorded_cells)
+    """
+    settings = parallel.shared
+    align1, align2, profile1, profile2 = job
+    record_cells(settings)
+    if profile1 is None:
+        alignment = timewarp.timewarp(settings['localdict'], align1, align2,
+                                      settings['window'], settings['coarse'])[0]
+        profile = None if settings['samples'] is None else consensus_profile(settings['samples'], alignment)
+    else:
+        alignment, cost, profile = profile_timewarp(profile1, profile2, align1, align2, settings['window'],
+                                                    settings['coarse'], settings['localdict'].block_elements)
+    return ((alignment, profile), recorded_cells(settings))
+
+def tree_timewarp(tree, samplelengths, localdict, pairwisedict, window = None, coarse = None,
+                  n_jobs = 1, merge_mode = 'average'):
+    """
+    performs progressive alignment following a guide tree
+
+    all merges of which both children are ready are performed in parallel, level by
+    level, by one pool of worker processes. levels with a single merge are performed in
+    this process. with a single linkage tree and 'average' merge mode the result is the
+    same as that of multiple_timewarp.
+    Args:
+        tree: guide tree, see guide_tree
+        samplelengths: list of ints, length of each sample
+        localdict: LocalDistStore with 2D local cost value grid for each sample pair
+        pairwisedict (dict): dictionary with alignments results for each pair
+                            pair entry: {'samplenum:samplenum'(str): alignment(dict)}
+                            pairwise alignments missing from it are performed when used
+        window: int (slices) or float < 1 (fraction of longest alignment), warping
+                window width. None: no window
+        coarse (tuple): (coarse_localdict, factor, radius) for approximate timewarping,
+                        see timewarp.approximate_band. None: exact timewarping
+        n_jobs (int): number of worker processes performing merges in parallel
+        merge_mode (str): 'average': local costs of merges are averaged over all sample
+                          pairs of both alignments. 'profile': merges are scored against
+                          consensus profiles of the alignments (samples of localdict)
+    Returns:
+        final alignment(dict): samples as keys (int), aligned slice indices values (list)
+            multiple_alignment_order (listof tuples): multiple alignment order
+                                      format:[((align1 samples),(align2 samples), cost)]
+    """
+    if merge_mode not in ('average', 'profile'):
+        raise ValueError("unknown merge mode: {}, use 'average' or 'profile'".format(merge_mode))
+    if not isinstance(tree, tuple):     # single sample, nothing to align
+        return ({str(tree): range(samplelengths[tree-1])}, [])
+    samples = localdict.samples if merge_mode == 'profile' else None
+    alignments = {}                     # node -> (samples key, alignment, consensus profile)
+    def get_alignment(node):
+        if isinstance(node, tuple):
+            return alignments[node]
+        profile = None if samples is None else samples[node-1]
+        return ((node,), {str(node): range(samplelengths[node-1])}, profile)
+
+    msa_order = []
+    shared_data = {'localdict': localdict, 'window': window, 'coarse': coarse, 'samples': samples}
+    with parallel.WorkerPool(n_jobs, shared_data) as pool:
+        for level in tree_levels(tree):
+            jobs = []
+            for left, right, cost in level:
+                (key1, align1, profile1), (key2, align2, profile2) = get_alignment(left), get_alignment(right)
+                leaf1, leaf2 = not isinstance(left, tuple), not isinstance(right, tuple)
+                if leaf1 and leaf2:         # sample pairs use the stored local distance grids
+                    pair = '{}:{}'.format(left, right)
+                    jobs.append(pairwisedict[pair] if pair in pairwisedict else (align1, align2, None, None))
+                elif leaf2:                 # the single sample goes first, as in multiple_timewarp
+                    jobs.append((align2, align1, profile2, profile1))
+                else:
+                    jobs.append((align1, align2, profile1, profile2))
+            todo = [job for job in jobs if isinstance(job, tuple)]
+            results = iter(store_cells(shared_data, pool.map(merge_timewarp, todo)))
+            for node, job in zip(level, jobs):
+                left, right, cost = node
+                key1, key2 = get_alignment(left)[0], get_alignment(right)[0]
+                leaf1, leaf2 = not isinstance(left, tuple), not isinstance(right, tuple)
+                if leaf1 != leaf2:          # internal cluster key first, then the added sample
+                    key = key2 + key1 if leaf1 else key1 + key2
+                else:
+                    key = key1 + key2
+                if isinstance(job, tuple):
+                    alignment, profile = next(results)
+                else:
+                    alignment, profile = job, None if samples is None else consensus_profile(samples, job)
+                alignments[node] = (key, alignment, profile)
+                msa_order.append((left if leaf1 else key1, right if leaf2 else key2, cost))
+    msa_order.sort(key = lambda entry: entry[2])
+    return (alignments[tree][1], msa_order)
+
+def medoid_sample(costmatrix):
+    """returns sample number (int, starting at 1) with lowest total pairwise alignment cost"""
+    return int(np.argmin(costmatrix.sum(axis = 1))) + 1
+
+def star_merge(reference, pair_alignments):
+    """
+    merges pairwise alignments to one reference sample into a multiple alignment
+
+    once a gap, always a gap: each reference slice gets as many aligned slices as the
+    pairwise alignment repeating it most. alignments that need fewer aligned slices for a
+    reference slice repeat their last slice index there (a gap).
+    Args:
+        reference (str): sample number of reference sample
+        pair_alignments (list): pairwise alignments (dict) of reference with each other
+                                sample, as returned by timewarp
+    Returns:
+        final alignment(dict): samples as keys (str), aligned slice indices values (list)
+    """
+    refindices = [np.asarray(alignment[reference]) for alignment in pair_alignments]
+    reflength = refindices[0][-1] + 1
+    counts = np.array([np.bincount(indices, minlength = reflength) for indices in refindices])
+    widths = counts.max(axis = 0)                 # aligned slices per reference slice
+    offsets = np.cumsum(widths) - widths
+    final_alignment = {reference: np.repeat(np.arange(reflength), widths).tolist()}
+    for alignment, indices, count in zip(pair_alignments, refindices, counts):
+        steps = np.arange(len(indices))
+        firststeps = np.cumsum(count) - count     # first step of each reference slice
+        positions = offsets[indices] + steps - firststeps[indices]
+        filled = np.zeros(widths.sum(), dtype = int)
+        filled[positions] = positions
+        filled = np.maximum.accumulate(filled)    # gap positions take the last filled position
+        for key, sampleindices in alignment.items():
+            if key != reference:
+                merged = np.zeros(widths.sum(), dtype = int)
+                merged[positions] = sampleindices
+                final_alignment[key] = merged[filled].tolist()
+    return final_alignment
+
+def star_timewarp(reference, samplelengths, localdict, window = None, coarse = None, n_jobs = 1):
+    """
+    performs star alignment: aligns all samples to one reference sample, in parallel
+
+    Args:
+        reference (int): sample number of reference sample (starting at 1), for example
+                         the medoid_sample of the pairwise cost matrix
+        samplelengths: list of ints, length of each sample
+        localdict: LocalDistStore with 2D local cost value grid for each sample pair
+        window: int (slices) or float < 1 (fraction of longest sample), warping window
+                width. None: no window
+        coarse (tuple): (coarse_localdict, factor, radius) for approximate timewarping,
+                        see timewarp.approximate_band. None: exact timewarping
+        n_jobs (int): number of worker processes aligning samples in parallel
+    Returns:
+        final alignment(dict): samples as keys (str), aligned slice indices values (list)
+            multiple_alignment_order (listof tuples): alignments to reference
+                                      format:[(reference, sample, cost)]
+    """
+    if reference < 1 or reference > len(samplelengths):
+        raise ValueError('star reference sample not recognized!: {}'.format(reference))
+    entries = dict((str(sample+1), {str(sample+1): range(length)}) for sample, length in enumerate(samplelengths))
+    pairs = [(str(reference), str(sample)) for sample in range(1, len(samplelengths)+1) if sample != reference]
+    if not pairs:                       # single sample, nothing to align
+        return ({str(reference): range(samplelengths[reference-1])}, [])
+    shared_data = {'localdict': localdict, 'entries': entries, 'window': window,
+                   'coarse': coarse, 'keep_alignments': True}
+    results = store_cells(shared_data, parallel.parallel_map(pair_timewarp, pairs, n_jobs, shared_data))
+    final_alignment = star_merge(str(reference), [result[0] for result in results])
+    msa_order = [(reference, int(pair[1]), result[1]) for pair, result in zip(pairs, results)]
+    return (final_alignment, msa_order)
+
+def add_samples(alignment, samples, samplelengths, localdict, window = None, coarse = None):
+    """
+    aligns new samples into an existing multiple alignment, one sample at a time
+
+    Args:
+        alignment (dict): existing multiple alignment, samples as keys (str), aligned
+                          slice indices as values (list)
+        samples (list): sample numbers (int, starting at 1) of the new samples
+        samplelengths: list of ints, length of each sample
+        localdict: LocalDistStore with 2D local cost value grid for each sample pair,
+                   only grids of pairs with new samples are used
+        window: int (slices) or float < 1 (fraction of longest alignment), warping
+                window width. None: no window
+        coarse (tuple): (coarse_localdict, factor, radius) for approximate timewarping,
+                        see timewarp.approximate_band. None: exact timewarping
+    Returns:
+        final alignment(dict): samples as keys (str), aligned slice indices values (list)
+            multiple_alignment_order (listof tuples): order in which samples were added
+                                      format:[(sample, (alignment samples), cost)]
+    """
+    key = tuple(int(sample) for sample in alignment.keys())
+    msa_order = []
+    for sample in samples:
+        new_align = {str(sample): range(samplelengths[sample-1])}
+        alignment, cost = timewarp.timewarp(localdict, new_align, alignment, window, coarse)
+        msa_order.append((sample, key, cost))
+        key = key + (sample,)
+    return (alignment, msa_order)
+
 def datawarp(data, alignment):
     """
     uses final alignemnt to warp complexome profiling data along the 'slice axis'
 
-    warps protein migration patterns by repeating intensity values at alignment gaps
+    warps protein migration patterns by repeating intensity values at alignment gaps,
+    gathering the aligned slices of each sample in one indexing operation
     Args:
-        data: 3D list structure with complexome profile sample intensity values
-                   of unaligned samples
+        data: 3D list structure or list of 2D np arrays (slices, proteins) with complexome
+              profile sample intensity values of unaligned samples
         final alignment(dict): samples as keys (int), aligned slice indices values (list)
     Returns:
-        warpeddata: 3D list structure with aligned intensity values for each sample
+        warpeddata: list of 2D np arrays (aligned slices, proteins), aligned intensity
+                    values for each sample
     """
-    warpeddata = []
-    samplenum = 0
-    for sample in data:
-        newsample = []
-        sample_alignment = alignment[str(samplenum+1)]       #get alignment 'x values' for this sample from alignment dictionary
-        for x in sample_alignment:                          # loop through all alignment x values for this sample
-            newsample.append(data[samplenum][x])            # append slice corresponding to alignment x value to new sample
-        warpeddata.append(newsample)                          # add new sample to warpeddata
-        samplenum += 1
-    return warpeddata
+    return [np.asarray(sample, dtype = float)[np.asarray(alignment[str(samplenum+1)])]
+            for samplenum, sample in enumerate(data)]
 
-def interpolate_sample(sample,alignment):
-    """
-    warp sample, using interpolation to fill gaps
-    """
-    dimensions = (sample.shape[0],len(alignment))
-    warped_data = np.full(dimensions, np.nan)
-    alignment_iterator = enumerate(alignment)
-    for ix,value in alignment_iterator:
-        if value != None:
-            warped_data[:,ix] = sample[:,value]
-        else:
-            gaps = 1
-            # look into the future for any extra Nones
-            for value in alignment[ix+1:]:
-                if value == None:
-                    gaps += 1
-                else:
-                    break
-
-            # error if sample starts with a gap
-            if ix == 0:
-                raise ValueError("sample starts with gap. "
-                "Option not implemented as this normally can't happen")
-
-            # get adjacent values
-            left_adj = sample[:,alignment[ix-1]]
-            try:
-                right_adj = sample[:,alignment[ix+gaps]]
-        
-            # catch and handle case where gaps last till end of sample
-            except IndexError:
-                fill_values = left_adj.repeat(gaps).reshape(dimensions[0],gaps)
-                warped_data[:,ix:] = fill_values
-                break
-            except Exception:
-                raise ValueError('something else went wrong with right_adj..')
-
-            # determine step sizes
-            diff = right_adj - left_adj
-            stepsizes = diff/(gaps + 1)
-
-            # get values to fill gaps
-            gap_array = np.arange(1,gaps+1)
-            to_add = np.outer(gap_array, stepsizes)
-            fill_values = (to_add + left_adj).transpose()
-            warped_data[:,ix:ix+gaps] = fill_values
-
-            # skip iterations over gap indexes that have been handled            
-            for i in range(gaps-1):
-                next(alignment_iterator)
-    
-    return warped_data
-
-def find_gaps(alignment):
+def interpolation_indices(indices):
     """
+    determines for each aligned slice which slices to interpolate between
+
+    repeated slice indices are gaps. gaps are filled by linear interpolation between the
+    slice before the gap and the first slice after it. gaps at the end of a sample repeat
+    the last slice.
+    Args:
+        indices: aligned slice indices of one sample (list or 1D int np array)
+    Returns:
+        left/right: 1D int np arrays, slice indices before and after each aligned slice
+        fractions: 1D np array, position between left and right (0: at left slice)
     """
-    previous = None
-    with_gaps = []
-    for value in alignment:
-        if value == previous:
-            with_gaps.append(None)
-        else:
-            with_gaps.append(value)
-        previous = value
-    return with_gaps
+    indices = np.asarray(indices)
+    positions = np.arange(len(indices))
+    starts = np.flatnonzero(np.concatenate(([True], indices[1:] != indices[:-1])))
+    runlengths = np.diff(np.append(starts, len(indices)))   # slice followed by its gaps
+    runs = np.repeat(np.arange(len(starts)), runlengths)
+    offsets = positions - starts[runs]
+    nextstarts = starts[runs] + runlengths[runs]
+    trailing = nextstarts == len(indices)
+    right = np.where(trailing, indices, indices[np.minimum(nextstarts, len(indices)-1)])
+    fractions = np.where(trailing, 0.0, offsets / runlengths[runs])
+    return (indices, right, fractions)
 
 def interpolation_warp(data, alignment):
     """
     warps data using (final) alignment
 
     fills gaps by interpolating based on values in adjacent slices
+    Args:
+        data: 3D list structure or list of 2D np arrays (slices, proteins) with complexome
+              profile sample intensity values of unaligned samples
+        final alignment(dict): samples as keys (int), aligned slice indices values (list)
+    Returns:
+        warpeddata: list of 2D np arrays (aligned slices, proteins), aligned intensity
+                    values for each sample
     """
     warpeddata = []
-    for ix,sample in enumerate(data):
-        sample_array = np.array(sample).transpose()
-        sample_alignment = alignment[str(ix+1)]
-        sample_gaps = find_gaps(sample_alignment)
-        warped_sample_array =interpolate_sample(sample_array,sample_gaps)
-        warped_sample = warped_sample_array.transpose().tolist()
-        warpeddata.append(warped_sample)
+    for samplenum, sample in enumerate(data):
+        sample = np.asarray(sample, dtype = float)
+        left, right, fractions = interpolation_indices(alignment[str(samplenum+1)])
+        leftvalues = sample[left]
+        warpeddata.append(leftvalues + fractions[:, np.newaxis] * (sample[right] - leftvalues))
     return warpeddata
 
+def warp_operator(indices, samplelength, warp_method = 'repeat'):
+    """
+    encodes the warp of one sample as a sparse (aligned slices x original slices) matrix
+
+    multiplying the matrix with any block of columns of the unaligned sample (original
+    slices x columns) warps these columns the same way as datawarp ('repeat') or
+    interpolation_warp ('interpolate'), see apply_warp.
+    Args:
+        indices: aligned slice indices of the sample (list or 1D int np array)
+        samplelength (int): number of slices of the unaligned sample
+        warp_method (str): 'repeat' or 'interpolate', how gaps are filled
+    Returns:
+        operator: localdist.CSRMatrix with 1 (repeat) or 2 (interpolated gap) weights
+                  per aligned slice
+    """
+    if warp_method == 'repeat':
+        left = right = np.asarray(indices)
+        fractions = np.zeros(len(left))
+    elif warp_method == 'interpolate':
+        left, right, fractions = interpolation_indices(indices)
+    else:
+        raise ValueError('warp method not recognized!: {}'.format(warp_method))
+    gaps = fractions > 0                # interpolated gaps also weigh the right slice
+    counts = 1 + gaps
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    cols = np.empty(indptr[-1], dtype = int)
+    weights = np.empty(indptr[-1])
+    cols[indptr[:-1]] = left
+    weights[indptr[:-1]] = 1 - fractions
+    cols[indptr[:-1][gaps] + 1] = right[gaps]
+    weights[indptr[:-1][gaps] + 1] = fractions[gaps]
+    return localdist.CSRMatrix(indptr, cols, weights, (len(left), samplelength))
+
+def warp_operators(alignment, samplelengths, warp_method = 'repeat'):
+    """
+    creates warp operator of each sample, see warp_operator
+
+    Args:
+        final alignment(dict): samples as keys (int), aligned slice indices values (list)
+        samplelengths: list of ints, length of each sample
+        warp_method (str): 'repeat' or 'interpolate', how gaps are filled
+    Returns:
+        operators (list): localdist.CSRMatrix warp operator for each sample
+    """
+    return [warp_operator(alignment[str(samplenum+1)], samplelength, warp_method)
+            for samplenum, samplelength in enumerate(samplelengths)]
+
+def apply_warp(operator, block):
+    """
+    warps a block of data columns of one sample with its warp operator
+
+    Args:
+        operator: localdist.CSRMatrix warp operator of the sample, see warp_operator
+        block: 2D np array or list structure (original slices, columns), for example
+               intensities of another quantification of the same sample
+    Returns:
+        warped: 2D np array (aligned slices, columns)
+    """
+    block = np.asarray(block, dtype = float)
+    if len(block) != operator.shape[1]:
+        raise ValueError('block has {} slices, warp operator expects {}'.format(len(block), operator.shape[1]))
+    values = operator.data.reshape((-1,) + (1,) * (block.ndim - 1)) * block[operator.indices]
+    return np.add.reduceat(values, operator.indptr[:-1], axis = 0)
+
 if __name__ == "__main__":
     # get test sample
     sample1 = [[0,3,8,1],[1,3,7,1],[2,1,6,1],[6,1,5,1],[7,1,4,1]]
@@ -239,5 +733,5 @@ if __name__ == "__main__":
     print(warped_data[0])
     print(warped_data[1])
 
-    print(np.array(warped_data[0]).transpose())
-    print(np.array(warped_data[1]).transpose())
\ No newline at end of file
+    print(warped_data[0].transpose())
+    print(warped_data[1].transpose())
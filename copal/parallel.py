@@ -0,0 +1,114 @@
+"""
+parallel module: runs independent computations in a pool of worker processes
+
+part of: COPAL -- COmplexome Profile ALignment Tool
+Copyright (C) 2018  Radboud universitair medisch centrum
+    for full notice, reference readme.md
+"""
+# import statements
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# read-only data shared with the worker functions, set once per worker process
+shared = {}
+
+# functions
+def worker_count(n_jobs):
+    """
+    determines number of worker processes to use
+
+    Args:
+        n_jobs (int or None): requested number of workers. None or 1 -> no parallelism,
+                              -1 -> all cpus, -2 -> all cpus but one, etc.
+    Returns:
+        workers (int): number of worker processes, at least 1
+    """
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    cpus = os.cpu_count() or 1
+    if n_jobs < 0:
+        return max(1, cpus + 1 + n_jobs)
+    return n_jobs
+
+def init_worker(shared_data):
+    """stores shared read-only data in worker process (pool initializer)"""
+    shared.clear()
+    shared.update(shared_data)
+
+def parallel_map(function, items, n_jobs = 1, shared_data = None, chunksize = 1, progress = None):
+    """
+    applies function to all items, in a process pool if more than one worker is used
+
+    function has to be a module level function, so it can be sent to worker processes.
+    it can access shared_data through the shared dictionary of this module.
+    Args:
+        function: module level function taking a single item
+        items (list): items to apply function to
+        n_jobs (int or None): number of worker processes, see worker_count
+        shared_data (dict): read-only data made available to function in parallel.shared
+        chunksize (int): number of items sent to a worker process at once
+        progress: function called with the number of finished items after each item,
+                  in item order. None: no progress reporting
+    Returns:
+        results (list): function results, in the same order as items
+    """
+    items = list(items)
+    with WorkerPool(min(worker_count(n_jobs), len(items)), shared_data) as pool:
+        return pool.map(function, items, chunksize, progress)
+
+class WorkerPool(object):
+    """
+    process pool for several parallel maps with the same shared data
+
+    worker processes are started at the first map with more than one item, and receive
+    shared_data once. maps of a single item, or with a single worker, run in this
+    process, using the same shared data.
+    """
+    def __init__(self, n_jobs = 1, shared_data = None):
+        """
+        Args:
+            n_jobs (int or None): number of worker processes, see worker_count
+            shared_data (dict): read-only data made available to mapped functions in
+                                parallel.shared
+        """
+        self.workers = worker_count(n_jobs)
+        self.shared_data = shared_data or {}
+        self.executor = None
+
+    def map(self, function, items, chunksize = 1, progress = None):
+        """applies function to all items, see parallel_map"""
+        items = list(items)
+        if self.workers <= 1 or len(items) <= 1:
+            # run in this process, sharing data the same way as in worker processes
+            previous = dict(shared)
+            init_worker(self.shared_data)
+            try:
+                return collect((function(item) for item in items), progress)
+            finally:
+                init_worker(previous)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers = self.workers, initializer = init_worker,
+                                                initargs = (self.shared_data,))
+        return collect(self.executor.map(function, items, chunksize = chunksize), progress)
+
+    def close(self):
+        """stops worker processes"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def collect(results, progress = None):
+    """collects results (iterable) in a list, reporting progress after each result"""
+    if progress is None:
+        return list(results)
+    collected = []
+    for result in results:
+        collected.append(result)
+        progress(len(collected))
+    return collected
@@ -53,6 +53,21 @@ def comp_within(groups):
                     comparisons.append(str(target) + ':' + str(sample))
             del targets[0]
     return comparisons
+
+def required_pairs(groups):
+    """
+    determines the sample combinations needed for the between and within group scores
+
+    Args:
+        groups (list): contains two lists with sample numbers belonging to each group
+    Returns:
+        comparisons (list): unique sample pairs to be evaluated: ['samplenum:samplenum']
+    """
+    comparisons = []
+    for comparison in comp_between(groups) + comp_within(groups):
+        if comparison not in comparisons:
+            comparisons.append(comparison)
+    return comparisons
     
 def get_sample_name_headers(sample_names):
     """
@@ -106,17 +121,17 @@ def shift_score(dataframe, groups, sample_names):
     new_subdata = [subframe, sub_between_scores, sub_within_scores, sub_total_scores]
     new_subframe =  pd.concat(new_subdata, axis = 1)
     
-    scoresframe = new_subframe.ix[:, -3:]
+    scoresframe = new_subframe.iloc[:, -3:]
     scoresframe.columns = ['Between', 'Within', 'Combined']
 
     final_frame = pd.merge(dataframe, scoresframe, left_index = True, right_index = True, how = 'outer')
     final_frame.sort_values('Combined', inplace = True, ascending = False)
     
     #replace 1:2 style comparison headers with sample names, after scores have been computed. (for user convenience)
+    #only the comparison columns present in the frame are renamed (all pairs or only the required pairs)
+    number_headers = get_sample_name_headers(list(range(1, len(sample_names)+1)))
     comparison_headers = get_sample_name_headers(sample_names)    # create headers list with sample name headers
-    all_headers = list(final_frame.columns)                       # take headers from final frame
-    all_headers[:len(comparison_headers)] = comparison_headers      
-    final_frame.columns = all_headers                   # assign new sample name headers to corresponding comparison columns 
+    final_frame = final_frame.rename(columns = dict(zip(number_headers, comparison_headers)))
 
     return final_frame
         
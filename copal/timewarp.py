@@ -5,117 +5,531 @@ part of: COPAL -- COmplexome Profile ALignment Tool
 Copyright (C) 2018  Radboud universitair medisch centrum
     for full notice, reference readme.md
 """
+# import statements
+import numpy as np
+
+# backtrace arrow codes: origin of each grid point in the dynamic programming grid
+START, UP, LEFT, DIAGONAL = 0, 1, 2, 3
+# (y, x) step back to the point of origin for each arrow code
+STEPS = {UP: (1, 0), LEFT: (0, 1), DIAGONAL: (1, 1)}
         
-def distcalc(localdict, align1, align2,y,x):
+def window_band(al1len, al2len, window = None):
     """
-    calculates local distances between local alignments at certain slice coordinate
-    
+    determines the grid points within a Sakoe-Chiba warping window
+
+    the window is a band around the diagonal from the start point to the outer corner
+    of the grid. it is widened where needed, so each row contains at least one point and
+    the band stays connected.
+    Args:
+        al1len/al2len (int): lengths of the two alignments (grid rows, columns)
+        window: int (number of slices) or float < 1 (fraction of the longest alignment),
+                maximum distance of grid points to the diagonal. None: no window
+    Returns:
+        band (tuple): 2 int np arrays, first and last column (inclusive) within the window
+                      for each row
+    """
+    if window is None:
+        return (np.zeros(al1len, dtype = int), np.full(al1len, al2len - 1, dtype = int))
+    if window < 0:
+        raise ValueError('warping window can not be negative: {}'.format(window))
+    if isinstance(window, float) and window < 1:
+        width = window * max(al1len, al2len)
+    else:
+        width = window
+    diagonal = np.arange(al1len) * ((al2len - 1) / float(max(1, al1len - 1)))
+    first = np.ceil(diagonal - width - 1e-9).astype(int)
+    last = np.floor(diagonal + width + 1e-9).astype(int)
+    return connect_band(first, last, al2len)
+
+def connect_band(first, last, al2len):
+    """
+    widens band so it runs from start point to outer corner without interruptions
+
+    Args:
+        first/last: int np arrays, first and last column (inclusive) for each row
+        al2len (int): number of grid columns
+    Returns:
+        band (tuple): first and last column for each row of the connected band
+    """
+    first = np.clip(first, 0, al2len - 1)
+    last = np.clip(last, 0, al2len - 1)
+    first[0] = 0                                         # first row contains the start point
+    last = np.maximum(last, first)
+    last[:-1] = np.maximum(last[:-1], first[1:] - 1)     # each row reaches the next row
+    last[-1] = al2len - 1                                # last row reaches the outer corner
+    return (first, last)
+
+def intersect_bands(band1, band2, al2len):
+    """returns connected band of grid points within both bands (None: no band)"""
+    if band1 is None:
+        return band2
+    if band2 is None:
+        return band1
+    return connect_band(np.maximum(band1[0], band2[0]), np.minimum(band1[1], band2[1]), al2len)
+
+def band_cells(band):
+    """
+    lists all grid points within a band
+
+    Args:
+        band (tuple): first and last column for each row, as returned by window_band
+    Returns:
+        rows, cols: int np arrays with row and column of each grid point in band
+    """
+    first, last = band
+    counts = last - first + 1
+    rows = np.repeat(np.arange(len(first)), counts)
+    cols = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - first, counts)
+    return (rows, cols)
+
+def band_offsets(band):
+    """
+    determines where each row starts in band layout: the grid points within a band,
+    row by row, in the order of band_cells
+
+    Args:
+        band (tuple): first and last column for each row, as returned by window_band
+    Returns:
+        starts: int np array, position of the first grid point of each row
+    """
+    first, last = band
+    counts = last - first + 1
+    return np.cumsum(counts) - counts
+
+def band_positions(band, starts, rows, cols):
+    """
+    finds grid points in band layout
+
+    Args:
+        band (tuple): first and last column for each row (first and last nondecreasing)
+        starts: int np array, band_offsets of band
+        rows/cols: int np arrays (broadcastable), row and column of grid points
+    Returns:
+        inband: bool np array, True for grid points within band
+        positions: int np array, position in band layout (0 for points outside band)
+    """
+    first, last = band
+    rows, cols = np.broadcast_arrays(rows, cols)
+    valid = (rows >= 0) & (rows < len(first))
+    safe_rows = np.where(valid, rows, 0)
+    inband = valid & (cols >= first[safe_rows]) & (cols <= last[safe_rows])
+    positions = np.where(inband, starts[safe_rows] + cols - first[safe_rows], 0)
+    return inband, positions
+
+def band_diagonal(lows, highs, diagonal):
+    """
+    returns rows of the grid points of a band on an anti-diagonal (y + x = diagonal)
+
+    Args:
+        lows/highs: int np arrays, y + first[y] and y + last[y] for each row y: the
+                    anti-diagonals of the first and last grid point of each row
+        diagonal (int): anti-diagonal index
+    Returns:
+        y: int np array, rows of grid points in band on anti-diagonal
+    """
+    return np.arange(np.searchsorted(highs, diagonal, side = 'left'),
+                     np.searchsorted(lows, diagonal, side = 'right'))
+
+def pair_indices(align1, align2):
+    """
+    collects sample indices and aligned slice indices of all sample pairs of 2 alignments
+
     Args:
-        localdict: dict with 2D local cost value grid for each sample pair
-        align1/2 (dict): samples as keys (int), aligned slice indices as values (list)
-        x/y: indices of slice pair to calculate local distance between.
-    Return: 
-        realdist: mean local distance between two alignemnts at slice pair: x,y
+        align1/2 (dict): samples as keys (str), aligned slice indices as values (list)
+    Returns:
+        pairs (list): tuple (align1 sample index, align2 sample index, align1 slice
+                      indices, align2 slice indices) for each sample pair. sample
+                      indices start at 0, slice indices are int np arrays
     """
-    dist = 0
+    pairs = []
     for key1 in align1.keys():
         for key2 in align2.keys():
-            if int(key1) <= int(key2):
-                dist += localdict[key1 + ':' + key2][align1[key1][y]][align2[key2][x]]
-                
-            else:
-                dist += localdict[key2 + ':' + key1][align2[key2][x]][align1[key1][y]]
-    comparisons = len(align1.keys())*len(align2.keys())
-    realdist = dist/comparisons
-    return realdist
+            pairs.append((int(key1)-1, int(key2)-1, np.asarray(align1[key1]), np.asarray(align2[key2])))
+    return pairs
+
+def pair_local_costs(localdict, pairs, rows, cols):
+    """
+    determines mean local distances between two alignments at given grid points
 
+    Args:
+        localdict: LocalDistStore with 2D local cost value grid for each sample pair
+        pairs (list): sample pairs of both alignments, as returned by pair_indices
+        rows/cols: int np arrays (broadcastable), grid points (alignment positions)
+    Returns:
+        np array of mean local distances, shape of broadcast rows and cols
+    """
+    values = 0
+    for sample1, sample2, indices1, indices2 in pairs:
+        values = values + localdict.values(sample1, sample2, indices1[rows], indices2[cols])
+    return values/len(pairs)
 
-def timewarp(localdict,align1,align2):
+def local_cost_matrix(localdict, align1, align2, band = None):
     """
-    performs timewarping between two alignments, using local distances stored in localdict
-    
+    assembles mean local distances between two alignments for all slice pairs
+
+    the local costs of each sample pair are gathered from its grid in one indexing
+    operation, so the dynamic programming itself only reads one value per grid point.
+    Args:
+        localdict: LocalDistStore with 2D local cost value grid for each sample pair
+        align1/2 (dict): samples as keys (str), aligned slice indices as values (list)
+        band (tuple): first and last column for each row, as returned by window_band.
+                      only grid points within band are assembled. None: all points
+    Returns:
+        localcost: without band: 2D np array of shape (al1len, al2len), mean local
+                   distance between the two alignments at each slice pair y,x.
+                   with band: 1D np array with the mean local distances of the grid
+                   points within band, in band layout (see band_offsets)
+    """
+    pairs = pair_indices(align1, align2)
+    if band is None:
+        return pair_local_costs(localdict, pairs, np.arange(len(pairs[0][2]))[:, np.newaxis],
+                                np.arange(len(pairs[0][3]))[np.newaxis, :])
+    rows, cols = band_cells(band)
+    return pair_local_costs(localdict, pairs, rows, cols)
+
+def band_localcost(localcost, band = None):
+    """
+    converts local costs to band layout
+
+    Args:
+        localcost: 2D np array of shape (al1len, al2len), or 1D np array in band layout
+        band (tuple): first and last column for each row. None: all grid points
+    Returns:
+        band (tuple): band of the local costs (all grid points if band was None)
+        localcost: 1D np array with local costs in band layout
+    """
+    localcost = np.asarray(localcost)
+    if band is None:
+        return window_band(localcost.shape[0], localcost.shape[1]), localcost.ravel()
+    if localcost.ndim == 2:
+        return band, localcost[band_cells(band)]
+    return band, localcost
+
+def dtw(localcost, band = None):
+    """
+    dynamic programming core: accumulates alignment costs over a local cost grid
+
+    grid points on the same anti-diagonal (y + x) only depend on points of the two
+    previous anti-diagonals, so each anti-diagonal is filled with one array operation.
+    only the grid points of each anti-diagonal within band are visited and stored (band
+    layout), so time and memory scale with the number of grid points in band.
+    the least costly point of origin is chosen in order up, left, diagonal: a later
+    origin is only chosen if it is strictly less costly.
+    Args:
+        localcost: 2D np array of shape (al1len, al2len) with local distances, or 1D np
+                   array with local distances in band layout (see band_offsets)
+        band (tuple): first and last column for each row, as returned by window_band.
+                      only grid points within band are computed. None: all points
+    Returns:
+        distcost: float np array with accumulated cost of each grid point
+        arrows: int8 np array with arrow code (START, UP, LEFT, DIAGONAL) of each grid
+                point, pointing to its point of origin
+        without band both are 2D arrays of shape (al1len, al2len), with band both are 1D
+        arrays in band layout. the outer corner is the last element in both cases
+    """
+    dense = band is None
+    band, localcost = band_localcost(localcost, band)
+    first, last = band
+    al1len, al2len = len(first), int(last[-1]) + 1
+    starts = band_offsets(band)
+    distcost = np.full(len(localcost), np.inf)
+    arrows = np.full(len(localcost), START, dtype = np.int8)
+    distcost[0] = localcost[0]
+    lows = np.arange(al1len) + first
+    highs = np.arange(al1len) + last
+
+    def accumulated(rows, cols):
+        inband, positions = band_positions(band, starts, rows, cols)
+        return np.where(inband, distcost[positions], np.inf)
+
+    # one anti-diagonal at a time, origins outside band (or outside the grid) cost inf
+    for diagonal in range(1, al1len + al2len - 1):
+        y = band_diagonal(lows, highs, diagonal)
+        x = diagonal - y
+        lowestcost = accumulated(y-1, x)
+        arrow = np.full(len(y), UP, dtype = np.int8)
+        for origin, cost in [(LEFT, accumulated(y, x-1)), (DIAGONAL, accumulated(y-1, x-1))]:
+            better = cost < lowestcost
+            lowestcost = np.where(better, cost, lowestcost)
+            arrow[better] = origin
+        positions = starts[y] + x - first[y]
+        distcost[positions] = lowestcost + localcost[positions]
+        arrows[positions] = arrow
+    if dense:
+        return distcost.reshape(al1len, al2len), arrows.reshape(al1len, al2len)
+    return distcost, arrows
+
+def backtrace(arrows, band = None):
+    """
+    follows arrows from the outer corner of the grid back to the start point
+
+    Args:
+        arrows: np array with arrow codes, as returned by dtw
+        band (tuple): band arrows were computed for (arrows in band layout).
+                      None: 2D arrows of all grid points
+    Returns:
+        alignment (list): forward trace of (y,x) grid points from start to outer corner
+    """
+    if band is None:
+        first = [0] * arrows.shape[0]
+        starts = [row * arrows.shape[1] for row in range(arrows.shape[0])]
+        arrows = arrows.ravel()
+        x = arrows.shape[0] // len(first) - 1
+    else:
+        first = band[0].tolist()
+        starts = band_offsets(band).tolist()
+        x = int(band[1][-1])
+    y = len(first) - 1
+    alignment = [(y, x)]
+    while arrows[starts[y] + x - first[y]] != START:
+        step = STEPS[arrows[starts[y] + x - first[y]]]
+        y, x = y - step[0], x - step[1]
+        alignment.append((y, x))
+    alignment.reverse()                            # reverse order of backtrace, to make it a forward trace
+    return alignment
+
+def warp_alignments(align1, align2, alignment):
+    """
+    warps two alignments along a forward trace, combining them in one new alignment
+
     Args:
-        localdict: dict with 2D local cost value grid for each sample pair
-        align1/2 (dict): input alignments samples as keys (int), aligned slice indices as
+        align1/2 (dict): input alignments samples as keys (str), aligned slice indices as
                          values (list)
+        alignment (list): forward trace of (y,x) grid points, as returned by backtrace
     Returns:
-        new_align: resulting alignment, samples as keys (int), aligned slice indices 
+        new_align: resulting alignment, samples as keys (str), aligned slice indices
                     as values (list)
-        alignment_cost: global cost of alignment
     """
-    # function that performs dynamic time warping, using local distance grids
-    # creates grid datastructures for local dists and backtrace arrows
-    # loops through all grid points
-    # perform backtrace
-    # warp starting series, store in new alignment dictionary 
-    
-    al1len = len(align1[next(iter(align1.keys()))])                   # length of alignments
-    al2len = len(align2[next(iter(align2.keys()))])
-
-    # initialise data structures. 2 grids, one with distance cost values, one with arrows for backtracing.
-    distcost = []
-    arrows = []
-    for i in range(al1len):          #add rows to the 2 grids  
-        distrow = []                    
-        arrowrow = []
-        for col in range(al2len):          #fill rows of both grids
-            distrow.append(None)
-            arrowrow.append((None,None))
-        distcost.append(distrow)
-        arrows.append(arrowrow)
-    
-    # loop that passes trough all grid points
-    for y in range(al1len):
-        for x in range(al2len):
-            # calculate distance costs and arrows for all grid points, store in respective data structures
-            # if at start point
-            if y == 0 and x == 0:
-                distcost[y][x] = distcalc(localdict,align1, align2,y,x)
-                arrows[y][x] = (None,None)
-            # elif at top edge
-            elif y == 0:
-                distcost[y][x] = distcost[y][(x-1)] + distcalc(localdict, align1, align2,y,x)
-                arrows[y][x] = (y,x-1)
-            # elif at left edge
-            elif x == 0:
-                distcost[y][x] = distcost[y-1][x] + distcalc(localdict, align1, align2,y,x)
-                arrows[y][x] = (y-1,x)
-            # else:  normal cases. dynamic programming takes place here. least costly point of origin is chosen
-            else:
-                lowestcost = distcost[y-1][x]             #
-                arrows[y][x] = (y-1,x)
-                if lowestcost > distcost[y][x-1]:
-                    lowestcost = distcost[y][x-1]
-                    arrows[y][x] = (y, x-1)
-                if lowestcost > distcost[y-1][x-1]:
-                    lowestcost = distcost[y-1][x-1]
-                    arrows[y][x] = (y-1,x-1)
-                distcost[y][x] = lowestcost + distcalc(localdict, align1, align2,y,x)
-
-
-    # backtrace alignment, store in list    --> MOVE TO NEW FUNCTION
-    alignment = []
-    y = al1len-1                           #y,x --> outer corner of arrows and distcost grid. location of alignment cost and first arrow
-    x = al2len-1                          
-    alignment_cost = distcost[y][x]                # storing alignment cost
-    alignment.append((y,x))                        # store first location in alignment
-    while x != None or y != None:
-        alignment.append(arrows[y][x])             # store next location in alignment
-        y,x = arrows[y][x][0], arrows[y][x][1]     # change x,y values according to arrow tuple at former x,y coordinates in arrows
-    del alignment[-1]                              # delete last entry of alignment, which is (None,None)
-    alignment.reverse()                            # reverse order of backtrace, to make it a forward trace
-    
-    # warp old alignment, store in new alignment  --> MOVE TO NEW FUNCTION
     new_align = {}
     for key in align1.keys():                          # loop through all sequences in align1
-        new_align[key] = []
-        for i in alignment:                            # loop through all values of the forward trace alignment
-            new_align[key].append(align1[key][i[0]])   # modify old sequences, acording to newly made alignment
+        new_align[key] = [align1[key][y] for y, x in alignment]
     for key in align2.keys():                          # do the same for align 2 sequences
-        new_align[key] = []
-        for i in alignment:
-            new_align[key].append(align2[key][i[1]])
-    
+        new_align[key] = [align2[key][x] for y, x in alignment]
+    return new_align
+
+def band_timewarp(localdict, align1, align2, band = None):
+    """
+    performs timewarping between two alignments, computing only grid points in band
+
+    Args:
+        localdict: LocalDistStore with 2D local cost value grid for each sample pair
+        align1/2 (dict): input alignments samples as keys (str), aligned slice indices as
+                         values (list)
+        band (tuple): first and last column for each row of grid points to compute.
+                      None: all grid points
+    Returns:
+        new_align: resulting alignment, samples as keys (str), aligned slice indices
+                    as values (list)
+        alignment_cost: global cost of alignment
+    """
+    localcost = local_cost_matrix(localdict, align1, align2, band)
+    distcost, arrows = dtw(localcost, band)
+    alignment_cost = float(distcost.flat[-1])       # outer corner
+    alignment = backtrace(arrows, band)
+    new_align = warp_alignments(align1, align2, alignment)
     return (new_align, alignment_cost)
-    
 
+def coarsen_alignment(alignment, factor):
+    """
+    converts alignment to alignment of slice-binned samples
+
+    Args:
+        alignment (dict): samples as keys (str), aligned slice indices as values (list)
+        factor (int): number of slices per bin
+    Returns:
+        coarse alignment (dict): every factor-th alignment position, bin indices as values
+    """
+    return dict((key, [index // factor for index in indices[::factor]])
+                for key, indices in alignment.items())
+
+def corridor_band(path, al1len, al2len, factor, radius):
+    """
+    projects warping path of binned alignments to a corridor of full resolution points
+
+    Args:
+        path (list): forward trace of (y,x) grid points of the binned alignments
+        al1len/al2len (int): lengths of the full resolution alignments
+        factor (int): number of slices per bin
+        radius (int): number of grid points the projected path is widened by
+    Returns:
+        band (tuple): first and last column for each row within the corridor
+    """
+    first = np.full(al1len, al2len, dtype = int)
+    last = np.full(al1len, -1, dtype = int)
+    for y, x in path:
+        rows = slice(y * factor, (y + 1) * factor)
+        first[rows] = np.minimum(first[rows], x * factor)
+        last[rows] = np.maximum(last[rows], (x + 1) * factor - 1)
+    return connect_band(first - radius, last + radius, al2len)
+
+def coarse_window_band(coarse1len, coarse2len, factor, window = None):
+    """
+    determines the warping window band at the resolution of slice bins
+
+    Args:
+        coarse1len/coarse2len (int): lengths of the binned alignments
+        factor (int): number of slices per bin
+        window: int (slices) or float < 1 (fraction of longest alignment), full
+                resolution warping window. None: no window
+    Returns:
+        band (tuple): first and last column for each binned row. None: no window
+    """
+    if window is None:
+        return None
+    coarse_window = window if isinstance(window, float) and window < 1 else int(np.ceil(window / float(factor)))
+    return window_band(coarse1len, coarse2len, coarse_window)
+
+def projected_band(path, al1len, al2len, factor, radius, window = None):
+    """
+    projects warping path of binned alignments to the full resolution band to compute
+
+    Args:
+        path (list): forward trace of (y,x) grid points of the binned alignments
+        al1len/al2len (int): lengths of the full resolution alignments
+        factor (int): number of slices per bin
+        radius (int): number of grid points the projected path is widened by
+        window: int (slices) or float < 1 (fraction of longest alignment), warping
+                window the corridor is limited to. None: no window
+    Returns:
+        band (tuple): first and last column for each row of the full resolution corridor
+    """
+    band = corridor_band(path, al1len, al2len, factor, radius)
+    if window is not None:
+        band = intersect_bands(band, window_band(al1len, al2len, window), al2len)
+    return band
+
+def approximate_band(align1, align2, coarse, window = None):
+    """
+    multiresolution timewarping (FastDTW style): warps binned alignments first
+
+    the alignments are warped at the resolution of slice bins, using local distances of
+    binned samples. the resulting path is projected to full resolution and widened by
+    a radius; timewarping at full resolution is only performed within this corridor.
+    Args:
+        align1/2 (dict): input alignments samples as keys (str), aligned slice indices as
+                         values (list)
+        coarse (tuple): (coarse_localdict, factor, radius). LocalDistStore of binned
+                        samples, number of slices per bin, corridor radius (slices)
+        window: int (slices) or float < 1 (fraction of longest alignment), warping
+                window, applied at both resolutions. None: no window
+    Returns:
+        band (tuple): first and last column for each row of the full resolution corridor
+    """
+    coarse_localdict, factor, radius = coarse
+    coarse1 = coarsen_alignment(align1, factor)
+    coarse2 = coarsen_alignment(align2, factor)
+    coarse_band = coarse_window_band(len(next(iter(coarse1.values()))), len(next(iter(coarse2.values()))),
+                                     factor, window)
+    localcost = local_cost_matrix(coarse_localdict, coarse1, coarse2, coarse_band)
+    path = backtrace(dtw(localcost, coarse_band)[1], coarse_band)
+    return projected_band(path, len(next(iter(align1.values()))), len(next(iter(align2.values()))),
+                          factor, radius, window)
+
+def warp_band(align1, align2, window = None, coarse = None):
+    """
+    determines the band of grid points to compute when timewarping two alignments
+
+    Args:
+        align1/2 (dict): input alignments samples as keys (str), aligned slice indices as
+                         values (list)
+        window: int (slices) or float < 1 (fraction of longest alignment), warping
+                window. None: no window
+        coarse (tuple): (coarse_localdict, factor, radius), settings for approximate
+                        multiresolution timewarping, see approximate_band.
+                        None: exact timewarping
+    Returns:
+        band (tuple): first and last column for each row. None: all grid points
+    """
+    if coarse is not None:
+        return approximate_band(align1, align2, coarse, window)
+    if window is not None:
+        return window_band(len(next(iter(align1.values()))), len(next(iter(align2.values()))), window)
+    return None
+
+def dtw_cost(localcost, band = None):
+    """
+    dynamic programming core without backtrace: only determines the alignment cost
+
+    keeps accumulated costs of the last two anti-diagonals only. local costs can be
+    given as a function, which is called for the grid points of one anti-diagonal at a
+    time: memory use is then linear in alignment length. gives the same cost as dtw.
+    Args:
+        localcost: 2D np array of shape (al1len, al2len) with local distances, 1D np
+                   array with local distances in band layout (see band_offsets), or
+                   function localcost(rows, cols) returning the local distances of
+                   grid points (int np arrays rows, cols)
+        band (tuple): first and last column for each row, as returned by window_band.
+                      only grid points within band are computed. None: all points
+                      (required if localcost is a function)
+    Returns:
+        alignment_cost: accumulated cost at the outer corner of the grid
+    """
+    if callable(localcost):
+        if band is None:
+            raise ValueError('band required when local costs are given as a function')
+        cost_function = localcost
+    else:
+        band, localcost = band_localcost(localcost, band)
+        starts = band_offsets(band)
+        cost_function = lambda rows, cols: localcost[starts[rows] + cols - band[0][rows]]
+    first, last = band
+    al1len, al2len = len(first), int(last[-1]) + 1
+    lows = np.arange(al1len) + first
+    highs = np.arange(al1len) + last
+    # accumulated costs of anti-diagonals, indexed by row + 1. index 0 stays inf,
+    # so grid points at the top edge get no origin from above. each buffer is reused
+    # for every third anti-diagonal, after resetting the positions written before
+    before = np.full(al1len + 1, np.inf)
+    previous = np.full(al1len + 1, np.inf)
+    previous[1] = cost_function(np.zeros(1, dtype = int), np.zeros(1, dtype = int))[0]
+    before_written, previous_written = slice(0, 0), slice(1, 2)
+    for diagonal in range(1, al1len + al2len - 1):
+        y = band_diagonal(lows, highs, diagonal)
+        x = diagonal - y
+        # up: (y-1,x), left: (y,x-1) on previous anti-diagonal. diagonal: (y-1,x-1)
+        lowestcost = np.minimum(np.minimum(previous[y], previous[y+1]), before[y])
+        current = before
+        current[before_written] = np.inf
+        current[y+1] = lowestcost + cost_function(y, x)
+        before, previous = previous, current
+        written = slice(y[0] + 1, y[-1] + 2) if len(y) else slice(0, 0)   # a diagonal step can skip an anti-diagonal
+        before_written, previous_written = previous_written, written
+    return float(previous[al1len])
+
+def timewarp_cost(localdict, align1, align2, window = None, coarse = None):
+    """
+    determines the cost of timewarping two alignments, without performing the alignment
+
+    local costs are gathered one anti-diagonal at a time, so no local cost matrix of the
+    alignments is assembled.
+    Args:
+        see timewarp
+    Returns:
+        alignment_cost: global cost of alignment, same as returned by timewarp
+    """
+    band = warp_band(align1, align2, window, coarse)
+    pairs = pair_indices(align1, align2)
+    if band is None:
+        band = window_band(len(pairs[0][2]), len(pairs[0][3]))
+    return dtw_cost(lambda rows, cols: pair_local_costs(localdict, pairs, rows, cols), band)
+
+def timewarp(localdict,align1,align2,window = None,coarse = None):
+    """
+    performs timewarping between two alignments, using local distances stored in localdict
+    
+    Args:
+        localdict: LocalDistStore with 2D local cost value grid for each sample pair
+        align1/2 (dict): input alignments samples as keys (str), aligned slice indices as
+                         values (list)
+        window: int (slices) or float < 1 (fraction of longest alignment), warping
+                window. only grid points within window are computed. None: no window
+        coarse (tuple): (coarse_localdict, factor, radius), settings for approximate
+                        multiresolution timewarping, see approximate_band.
+                        None: exact timewarping
+    Returns:
+        new_align: resulting alignment, samples as keys (str), aligned slice indices 
+                    as values (list)
+        alignment_cost: global cost of alignment
+    """
+    band = warp_band(align1, align2, window, coarse)
+    return band_timewarp(localdict, align1, align2, band)
@@ -10,6 +10,8 @@ Copyright (C) 2018  Radboud universitair medisch centrum
 import pandas as pd
 import numpy as np
 import os
+from . import multipletimewarp as msa_warp
+from . import hausdorff
 
 # functions
 def show_gap(alignment):
@@ -79,6 +81,7 @@ def text_output(input, output, align_info, output_path):
         - clustering step of progressive alignment
         - gap locations for each sample
         - groups used for hausdorff calculations
+        - hausdorff distances taken from the fast path
         - location where output is stored on drive
     
     Args:
@@ -123,19 +126,33 @@ def text_output(input, output, align_info, output_path):
             put("%d  %s"%(i+1,input['samplenames'][i]), txtfile)
 
         # clustering info
-        paircostkeys = sorted(output['pairwisecosts'].keys())
-        put("\npairwise clustering results (from low to high cost):", txtfile)
-        for key in paircostkeys:
-            put("pair: " + str(output['pairwisecosts'][key]) + "   cost: " + str(key), txtfile) 
+        if output['pairwisecosts'] is not None:
+            paircosts = msa_warp.cost_pairs(output['pairwisecosts'])
+            put("\npairwise clustering results (from low to high cost):", txtfile)
+            for cost, sample1, sample2 in paircosts:
+                put("pair: %d:%d   cost: %s"%(sample1, sample2, cost), txtfile)
 
-        put("\npairwise matches ordered by cost scores from low to high:", txtfile)
-        sortedpairs = []
-        for i in paircostkeys:
-            sortedpairs.append(output['pairwisecosts'][i])
-        put(str(sortedpairs), txtfile)  
+            put("\npairwise matches ordered by cost scores from low to high:", txtfile)
+            sortedpairs = ['%d:%d'%(sample1, sample2) for cost, sample1, sample2 in paircosts]
+            put(str(sortedpairs), txtfile)  
+        else:
+            put("\npairwise alignments of all samples skipped", txtfile)
         put("", txtfile)
         put("Alignment order: " +  str(output['multiple_alignment_order']), txtfile)
+        if output['guide_tree'] is not None:
+            put("Guide tree: " + str(output['guide_tree']), txtfile)
         put("", txtfile)
+
+        # approximate alignment info
+        if output['approximation_costs'] != None:
+            put("approximate vs exact pairwise alignment costs:", txtfile)
+            differences = []
+            for pair, approximate, exact in output['approximation_costs']:
+                difference = (approximate - exact)/exact*100 if exact != 0 else 0.0
+                differences.append(difference)
+                put("pair: {}   approximate: {}   exact: {}   difference: {:.3f}%".format(pair, approximate, exact, difference), txtfile)
+            put("mean cost difference: {:.3f}%".format(sum(differences)/len(differences)), txtfile)
+            put("", txtfile)
         
         # gap location info
         put("visualision of gap locations of final alignment: ", txtfile)
@@ -145,6 +162,15 @@ def text_output(input, output, align_info, output_path):
         if input['hausdorff_scoring']:
             put("groups used for combined scores: " +str(input['groups']), txtfile)
 
+    # hausdorff fast path info
+    if input['hausdorff_scoring'] and output['hausdorff_fast_path'] is not None:
+        counts = output['hausdorff_fast_path']
+        put("\nhausdorff fast path:", txtfile)
+        put("proteins: {}   without intensity: {}".format(counts['proteins'], counts['zero rows']), txtfile)
+        put("sample pair distances: {}".format(counts['distances']), txtfile)
+        for fast_class in hausdorff.FAST_CLASSES:
+            put("    {}: {}".format(fast_class, counts[fast_class]), txtfile)
+
     # close file and return to starting directory after storing file in results folder
     txtfile.close()
     os.chdir('..')
@@ -60,4 +60,63 @@ copal.main(input = input)
                   hausdorff effect size calculation
         'hausd_factor' (float): ratio of height to width of plain in which hausdorff
                                 distances are calculated
+        'warp_method': string, 'repeat' or 'interpolate', how gaps are filled when
+                       warping data
+
+----optional input: left out to use default values----
+
+        'localdist_engine': string, 'numpy' (default), 'sparse' or 'reference', engine
+                            used to calculate local distances. 'sparse' is fastest for
+                            profiles that are mostly zero
+        'n_jobs': int, number of worker processes used for parallel computations
+                  (default 1: no parallelism, -1: all cpus)
+        'localdist_dtype': string, 'float64' (default) or 'float32', float type in which
+                           local distance grids are stored
+        'localdist_memory': number, memory budget in MB for temporary arrays used per
+                            local distance grid computation (default 32). sample data and
+                            stored grids come on top of the budget
+        'window': int (slices) or float < 1 (fraction of sample length), width of warping
+                  window around the diagonal (default None: no window)
+        'warp_mode': string, 'exact' (default) or 'approximate'. approximate warps
+                     slice-binned samples first, and refines the alignment at full
+                     resolution only within a corridor around the binned alignment
+        'coarse_factor': int, number of slices per bin in approximate mode (default 4)
+        'coarse_radius': int, corridor radius in slices in approximate mode (default 2)
+        'report_exact_cost': boolean, in approximate mode also perform exact pairwise
+                             alignments and report cost differences (default False)
+        'linkage': string, 'single' (default) or 'average' (UPGMA), linkage used to build
+                   the guide tree for multiple alignment
+        'merge_mode': string, 'average' (default) or 'profile'. 'profile' scores merges of
+                      partial alignments against their consensus profiles (mean warped
+                      intensities), so merge costs do not grow with the number of samples
+        'msa_method': string, 'progressive' (default) or 'star'. 'star' aligns all samples
+                      to one reference sample and merges these alignments
+        'star_reference': int, sample number (starting at 1) of the reference sample for
+                          star alignment, skipping pairwise alignments of all samples.
+                          default None: the medoid sample (lowest total pairwise cost)
+        'guide_costs': string, 'alignment' (default) or 'intensity', sample distances used
+                       for the alignment order. 'intensity' timewarps total intensity
+                       traces instead of performing pairwise alignments of all samples
+        'load_alignment': string, path of _alignment.npz file saved by an earlier run on the
+                          same data. alignment is skipped, data is warped using the loaded
+                          alignment (default None: perform alignment)
+        'incremental': boolean, with 'load_alignment': samples after the samples of the
+                       loaded alignment are new, and are aligned into the loaded
+                       alignment (default False)
+        'load_localdist': string, path of _localdist.npz file saved by the run that saved
+                          the loaded alignment, reused in incremental mode
+        'save_localdist': boolean, save local distance grids in _localdist.npz file, for
+                          later incremental runs (default False)
+        'hausdorff_engine': string, 'batch' (default), 'ordered' or 'reference', engine
+                            used to calculate hausdorff distances. 'batch' computes all
+                            proteins at once, 'ordered' uses an exact expanding window
+                            search per protein
+        'hausdorff_chunk_size': int, number of proteins per hausdorff task; chunks are scored
+                                in parallel with n_jobs workers (default 500)
+        'hausdorff_pairs': string, 'all' (default): hausdorff distances of all sample pairs in
+                           the score output, 'required': only the pairs used by the between
+                           and within group scores
+        'hausdorff_fast_path': boolean, take hausdorff distances of all zero, identical and
+                               single peak samples from closed forms instead of computing
+                               them (default True)
 """
\ No newline at end of file
@@ -0,0 +1,76 @@
+from copal import alignfile
+from copal import localdist
+from copal import multipletimewarp
+import unittest
+import tempfile
+import os
+import numpy as np
+
+class TestAlignfile(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(2)
+        self.data = [rng.randint(0, 5, size = (slices, 6)).astype(float) for slices in [9, 11, 10]]
+        samplelengths = [len(sample) for sample in self.data]
+        store = localdist.pairwise_localdist(self.data, engine = 'numpy')
+        pairwisecosts = multipletimewarp.pairwise_timewarp(self.data, samplelengths, store)[1]
+        tree = multipletimewarp.guide_tree(pairwisecosts)
+        alignment, msa_order = multipletimewarp.tree_timewarp(tree, samplelengths, store, {})
+        self.output = {'final_alignment': alignment, 'multiple_alignment_order': msa_order,
+                       'pairwisecosts': pairwisecosts, 'guide_tree': tree, 'samplelengths': samplelengths,
+                       'sample_hashes': alignfile.sample_hashes(self.data)}
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'test_alignment.npz')
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rmdir(self.directory)
+
+    def test_save_load(self):
+        alignfile.save_alignment(self.filename, self.output)
+        alignment, msa_order, pairwisecosts, tree = alignfile.load_alignment(self.filename, self.data)
+        self.assertEqual(alignment, self.output['final_alignment'])
+        self.assertEqual(msa_order, self.output['multiple_alignment_order'])
+        self.assertTrue(np.array_equal(pairwisecosts, self.output['pairwisecosts']))
+        self.assertEqual(tree, self.output['guide_tree'])
+
+    def test_star_without_costs(self):
+        self.output['pairwisecosts'] = None
+        self.output['guide_tree'] = None
+        alignfile.save_alignment(self.filename, self.output)
+        alignment, msa_order, pairwisecosts, tree = alignfile.load_alignment(self.filename)
+        self.assertEqual(pairwisecosts, None)
+        self.assertEqual(tree, None)
+
+    def test_data_mismatch(self):
+        alignfile.save_alignment(self.filename, self.output)
+        changed = [sample.copy() for sample in self.data]
+        changed[1][0, 0] += 1
+        self.assertRaises(ValueError, alignfile.load_alignment, self.filename, changed)
+        self.assertRaises(ValueError, alignfile.load_alignment, self.filename, self.data[:2])
+        extra = self.data + [np.ones((7, 6))]
+        self.assertRaises(ValueError, alignfile.load_alignment, self.filename, extra)
+        alignment = alignfile.load_alignment(self.filename, extra, new_samples = True)[0]
+        self.assertEqual(sorted(alignment.keys()), ['1', '2', '3'])
+
+    def test_new_proteins(self):
+        alignfile.save_alignment(self.filename, self.output)
+        # an added gel with new proteins: earlier samples are complemented with zero intensities
+        complemented = [np.hstack([sample, np.zeros((len(sample), 2))]) for sample in self.data]
+        rng = np.random.RandomState(3)
+        added = complemented + [rng.randint(0, 5, size = (12, 8)).astype(float)]
+        alignment = alignfile.load_alignment(self.filename, added, new_samples = True)[0]
+        self.assertEqual(alignment, self.output['final_alignment'])
+        complemented[0][0, -1] = 1
+        self.assertRaises(ValueError, alignfile.load_alignment, self.filename, complemented)
+
+        localdict = localdist.extend_store(localdist.LocalDistStore(self.output['samplelengths'], pairs = []),
+                                           added, engine = 'numpy')
+        samplelengths = [len(sample) for sample in added]
+        final, msa_order = multipletimewarp.add_samples(alignment, [4], samplelengths, localdict)
+        self.assertEqual(sorted(final.keys()), ['1', '2', '3', '4'])
+        self.assertEqual(len(set(len(indices) for indices in final.values())), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+from copal import findshift
+from copal import shiftscore
+import unittest
+import numpy as np
+import pandas as pd
+
+class TestFindshift(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(3)
+        cls.samplelengths = [12, 12, 12, 12]
+        values = rng.rand(20, 48) * 100
+        values[values < 60] = 0
+        values[3] = 0                                   # protein without intensity
+        headers = ['S{}_{}'.format(sample, sl) for sample in range(1, 5) for sl in range(1, 13)]
+        cls.frame = pd.DataFrame(values, columns = headers, index = ['P{}'.format(i) for i in range(20)])
+        cls.frame.index.name = 'Gi'
+        cls.alignment = {'1': list(range(12)), '2': [0,0,1,2,3,4,5,6,7,8,9,10],
+                         '3': [0,1,2,3,3,3,4,5,6,7,8,9], '4': [0,1,2,3,4,5,6,7,8,9,10,10]}
+        cls.groups = [[1, 2], [3, 4]]
+
+    def test_batch_engine(self):
+        reference = findshift.find_hausdorff(self.frame, self.samplelengths, self.frame, self.alignment,
+                                             self.groups, None, 1.0)[0]
+        batch = findshift.find_hausdorff(self.frame, self.samplelengths, self.frame, self.alignment,
+                                         self.groups, None, 1.0, engine = 'batch')[0]
+        self.assertEqual(list(batch.columns), list(reference.columns))
+        self.assertEqual(list(batch.index), list(reference.index))
+        headers = findshift.get_headers(4)
+        np.testing.assert_allclose(batch[headers].values, reference[headers].values, rtol = 1e-12)
+        np.testing.assert_allclose(batch['intensity diffs'].values.astype(float),
+                                   reference['intensity diffs'].values.astype(float), rtol = 1e-12)
+        self.assertTrue(np.isnan(batch['intensity diffs']['P3']))
+
+    def test_ordered_engine(self):
+        reference = findshift.find_hausdorff(self.frame, self.samplelengths, self.frame, self.alignment,
+                                             self.groups, None, 1.0)[0]
+        ordered = findshift.find_hausdorff(self.frame, self.samplelengths, self.frame, self.alignment,
+                                           self.groups, None, 1.0, engine = 'ordered')[0]
+        headers = findshift.get_headers(4)
+        np.testing.assert_array_equal(ordered[headers].values, reference[headers].values)
+
+    def test_parallel_chunks(self):
+        serial = findshift.find_hausdorff(self.frame, self.samplelengths, self.frame, self.alignment,
+                                          self.groups, None, 1.0)[0]
+        for engine in ('reference', 'batch'):
+            chunked = findshift.find_hausdorff(self.frame, self.samplelengths, self.frame, self.alignment,
+                                               self.groups, None, 1.0, engine = engine, n_jobs = 2,
+                                               chunk_size = 3)[0]
+            self.assertEqual(list(chunked.index), list(serial.index))
+            headers = findshift.get_headers(4)
+            np.testing.assert_allclose(chunked[headers].values, serial[headers].values, rtol = 1e-12)
+            np.testing.assert_allclose(chunked['intensity diffs'].values.astype(float),
+                                       serial['intensity diffs'].values.astype(float), rtol = 1e-12)
+
+    def test_required_pairs(self):
+        groups = [[1], [3, 4]]                          # sample 2 excluded
+        pairs = shiftscore.required_pairs(groups)
+        full = findshift.find_hausdorff(self.frame, self.samplelengths, self.frame, self.alignment,
+                                        groups, None, 1.0)[0]
+        for engine in ('reference', 'batch'):
+            required = findshift.find_hausdorff(self.frame, self.samplelengths, self.frame, self.alignment,
+                                                groups, None, 1.0, engine = engine, pairs = pairs)[0]
+            self.assertEqual(list(required.columns), ['1:3', '1:4', '3:4', 'intensity diffs'])
+            np.testing.assert_allclose(required[['1:3', '1:4', '3:4']].values,
+                                       full[['1:3', '1:4', '3:4']].values, rtol = 1e-12)
+        names = ['a', 'b', 'c', 'd']
+        full_scores = shiftscore.shift_score(full, groups, names)
+        required_scores = shiftscore.shift_score(required, groups, names)
+        self.assertEqual(list(required_scores.columns[:3]), ['a:c', 'a:d', 'c:d'])
+        self.assertIn('b:c', full_scores.columns)
+        np.testing.assert_allclose(required_scores['Combined'].values.astype(float),
+                                   full_scores.loc[required_scores.index, 'Combined'].values.astype(float),
+                                   rtol = 1e-12)
+
+    def test_fast_path(self):
+        frame = self.frame.copy()
+        frame.iloc[5, 1] = 0                                       # at gap of sample 2
+        frame.iloc[5, 12:24] = frame.iloc[5, :12].values          # identical samples 1 and 2
+        frame.iloc[6] = 0
+        frame.iloc[6, [2, 15, 40]] = [5.0, 80.0, 20.0]             # single peaks
+        for engine in ('reference', 'batch'):
+            computed = findshift.find_hausdorff(frame, self.samplelengths, frame, self.alignment,
+                                                self.groups, None, 1.0, engine = engine, fast_path = False)
+            fast, counts = findshift.find_hausdorff(frame, self.samplelengths, frame, self.alignment,
+                                                    self.groups, None, 1.0, engine = engine)
+            np.testing.assert_array_equal(fast.values.astype(float), computed[0].values.astype(float))
+            self.assertEqual(computed[1]['computed'], 20 * 6)
+            self.assertEqual(counts['zero rows'], 1)
+            self.assertEqual(counts['zero'], 6)
+            self.assertGreaterEqual(counts['identical'], 1)
+            self.assertGreaterEqual(counts['single peak'], 3)
+            self.assertEqual(sum(counts[fast_class] for fast_class in findshift.hausdorff.FAST_CLASSES),
+                             counts['distances'])
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, findshift.find_hausdorff, self.frame, self.samplelengths, self.frame,
+                          self.alignment, self.groups, None, 1.0, engine = 'gpu')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -34,6 +34,19 @@ class TestHausdorff(unittest.TestCase):
         for ix,series in enumerate(self.array1):
             self.assertEqual(hausdorff.hausdorff(series,self.array2[ix]),1)
 
+    def test_ordered_hausdorff(self):
+        self.assertEqual(hausdorff.ordered_hausdorff(self.list1, self.list2),
+                        4799.000104188372)
+        self.assertEqual(hausdorff.ordered_hausdorff(self.list3, self.list4),
+                        11.045361017187261)
+        rng = np.random.RandomState(0)
+        for length1, length2 in [(20, 20), (15, 25), (1, 9), (30, 30)]:
+            series1 = rng.rand(length1) * length1
+            series2 = rng.rand(length2) * length2
+            series1[series1 < length1/2.] = 0
+            self.assertEqual(hausdorff.ordered_hausdorff(series1, series2),
+                             hausdorff.hausdorff(series1, series2))
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,131 @@
+from copal import localdist
+import unittest
+import tempfile
+import os
+import numpy as np
+
+class TestLocaldist(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(0)
+        cls.data = []
+        for slices in [12, 15, 9]:
+            sample = rng.rand(slices, 40)
+            sample[sample < 0.7] = 0
+            cls.data.append(sample.tolist())
+
+    def test_array_localdist(self):
+        reference = localdist.localdist(self.data[0], self.data[1])
+        result = localdist.array_localdist(self.data[0], self.data[1])
+        self.assertEqual(result.shape, (12, 15))
+        np.testing.assert_allclose(result, reference)
+
+    def test_pairwise_engines(self):
+        reference = localdist.pairwise_localdist(self.data, engine = 'reference')
+        result = localdist.pairwise_localdist(self.data, engine = 'numpy')
+        np.testing.assert_allclose(result.buffer, reference.buffer)
+
+    def test_protein_blocks(self):
+        expected = localdist.array_localdist(self.data[0], self.data[1])
+        for block_elements in [1, 15, 100, 15*7, 10**6]:
+            result = localdist.array_localdist(self.data[0], self.data[1], block_elements)
+            np.testing.assert_allclose(result, expected)
+        sparse = localdist.sparse_localdist(self.data[0], self.data[1], 3)
+        np.testing.assert_allclose(sparse, expected, atol = 1e-9)
+        store = localdist.pairwise_localdist(self.data, engine = 'numpy', max_memory = 0.01)
+        np.testing.assert_allclose(store.grid(0, 1), expected)
+
+    def test_protein_block_order(self):
+        rng = np.random.RandomState(4)
+        sample1, sample2 = rng.rand(40, 3000) * 1e3, rng.rand(45, 3000) * 1e3
+        expected = localdist.array_localdist(sample1, sample2, 10**9)
+        for block_elements in [localdist.PROTEIN_BLOCK, 45*100, 10**6]:
+            np.testing.assert_array_equal(localdist.array_localdist(sample1, sample2, block_elements), expected)
+        rows, cols = np.nonzero(np.ones((40, 45)))
+        cells = localdist.cell_localdist(sample1, sample2, rows, cols, 1000)
+        np.testing.assert_array_equal(cells, expected.ravel())
+
+    def test_sparse_localdist(self):
+        sparse = localdist.csr_sample(self.data[1])
+        self.assertEqual(sparse.shape, (15, 40))
+        self.assertEqual(len(sparse.data), np.count_nonzero(self.data[1]))
+        reference = localdist.localdist(self.data[1], self.data[2])
+        result = localdist.sparse_localdist(sparse, localdist.csr_sample(self.data[2]))
+        np.testing.assert_allclose(result, reference, atol = 1e-9)
+        store = localdist.pairwise_localdist(self.data, engine = 'sparse')
+        np.testing.assert_allclose(store.grid(0, 1), localdist.localdist(self.data[0], self.data[1]), atol = 1e-9)
+
+    def test_store(self):
+        store = localdist.pairwise_localdist(self.data, engine = 'numpy')
+        self.assertEqual(store.pairs(), [(0, 1), (0, 2), (1, 2)])
+        self.assertEqual(store.buffer.size, 12*15 + 12*9 + 15*9)
+        for i, j in store.pairs():
+            self.assertEqual(store.pair_index(i, j), store.pair_index(j, i))
+            expected = localdist.localdist(self.data[i], self.data[j])
+            np.testing.assert_allclose(store.grid(i, j), expected)
+            np.testing.assert_allclose(store.grid(j, i), np.transpose(expected))
+        with self.assertRaises(ValueError):
+            store.grid(1, 1)
+
+    def test_window_engines(self):
+        full = localdist.pairwise_localdist(self.data, engine = 'numpy')
+        for engine in ['reference', 'numpy', 'sparse']:
+            store = localdist.pairwise_localdist(self.data, engine = engine, window = 2)
+            self.assertLess(store.buffer.size, full.buffer.size)      # only band cells stored
+            self.assertFalse(np.isnan(store.buffer).any())
+            for i, j in store.pairs():
+                grid = store.grid(i, j)
+                inband = ~np.isnan(grid)
+                np.testing.assert_allclose(grid[inband], full.grid(i, j)[inband], atol = 1e-9)
+        filename = os.path.join(tempfile.mkdtemp(), 'localdist.npz')
+        localdist.save_store(filename, store)
+        loaded = localdist.load_store(filename)
+        os.remove(filename)
+        os.rmdir(os.path.dirname(filename))
+        self.assertEqual(loaded.window, 2)
+        np.testing.assert_array_equal(loaded.buffer, store.buffer)
+
+    def test_store_float32(self):
+        store = localdist.pairwise_localdist(self.data, engine = 'numpy', dtype = np.float32)
+        self.assertEqual(store.buffer.dtype, np.float32)
+        expected = localdist.localdist(self.data[0], self.data[2])
+        np.testing.assert_allclose(store.grid(0, 2), expected, rtol = 1e-6)
+
+    def test_parallel(self):
+        serial = localdist.pairwise_localdist(self.data, engine = 'numpy')
+        result = localdist.pairwise_localdist(self.data, engine = 'numpy', n_jobs = 2)
+        np.testing.assert_array_equal(result.buffer, serial.buffer)
+
+    def test_extend_store(self):
+        full = localdist.pairwise_localdist(self.data, engine = 'numpy')
+        old = localdist.pairwise_localdist(self.data[:2], engine = 'numpy')
+        filename = os.path.join(tempfile.mkdtemp(), 'localdist.npz')
+        localdist.save_store(filename, old)
+        loaded = localdist.load_store(filename)
+        os.remove(filename)
+        os.rmdir(os.path.dirname(filename))
+        np.testing.assert_array_equal(loaded.buffer, old.buffer)
+        extended = localdist.extend_store(loaded, self.data, engine = 'numpy')
+        np.testing.assert_allclose(extended.buffer, full.buffer)
+        # without grids of the existing samples only grids with new samples are computed
+        empty = localdist.extend_store(localdist.LocalDistStore([12, 15], pairs = []), self.data, engine = 'numpy')
+        self.assertEqual(empty.pairs(), [(0, 2), (1, 2)])
+        self.assertEqual(empty.buffer.size, 12*9 + 15*9)
+        self.assertRaises(ValueError, empty.grid, 0, 1)
+        np.testing.assert_allclose(empty.grid(2, 1), full.grid(2, 1))
+        filename = os.path.join(tempfile.mkdtemp(), 'localdist.npz')
+        localdist.save_store(filename, empty)
+        loaded = localdist.load_store(filename)
+        os.remove(filename)
+        os.rmdir(os.path.dirname(filename))
+        self.assertEqual(loaded.pairs(), empty.pairs())
+        np.testing.assert_array_equal(loaded.buffer, empty.buffer)
+        self.assertRaises(ValueError, localdist.extend_store, old, self.data[1:])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            localdist.pairwise_localdist(self.data, engine = 'fortran')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+from copal import localdist
+from copal import multipletimewarp
+from copal import timewarp
+import unittest
+import numpy as np
+
+class TestMultipleTimewarp(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(4)
+        cls.data = [rng.randint(0, 5, size = (slices, 8)).astype(float) for slices in [10, 13, 8, 11, 12]]
+        cls.samplelengths = [len(sample) for sample in cls.data]
+        cls.store = localdist.pairwise_localdist(cls.data, engine = 'numpy')
+
+    def test_lazy_pairwise_alignments(self):
+        pairwisedict, pairwisecosts = multipletimewarp.pairwise_timewarp(self.data, self.samplelengths, self.store)
+        self.assertEqual(pairwisedict, {})
+        fullpairwisedict, fullpairwisecosts = multipletimewarp.pairwise_timewarp(self.data, self.samplelengths,
+                                                                                  self.store, keep_alignments = True)
+        self.assertEqual(len(fullpairwisedict), 10)
+        self.assertTrue(np.array_equal(pairwisecosts, fullpairwisecosts))
+        lazy = multipletimewarp.multiple_timewarp(pairwisecosts, self.samplelengths, self.store, pairwisedict)
+        full = multipletimewarp.multiple_timewarp(fullpairwisecosts, self.samplelengths, self.store, fullpairwisedict)
+        self.assertEqual(lazy[1], full[1])
+        self.assertEqual(lazy[0], dict((key, list(value)) for key, value in full[0].items()))
+
+    def test_parallel_pairwise(self):
+        serial = multipletimewarp.pairwise_timewarp(self.data, self.samplelengths, self.store,
+                                                     keep_alignments = True)
+        parallel = multipletimewarp.pairwise_timewarp(self.data, self.samplelengths, self.store,
+                                                       keep_alignments = True, n_jobs = 2)
+        self.assertTrue(np.array_equal(parallel[1], serial[1]))
+        self.assertEqual(parallel[0], serial[0])
+
+    def test_cost_matrix(self):
+        pairwisedict, costmatrix = multipletimewarp.pairwise_timewarp(self.data, self.samplelengths, self.store,
+                                                                      keep_alignments = True)
+        self.assertEqual(costmatrix.shape, (5, 5))
+        self.assertTrue(np.array_equal(costmatrix, costmatrix.T))
+        pairs = multipletimewarp.cost_pairs(costmatrix)
+        self.assertEqual(len(pairs), 10)       # pairs with equal costs are all kept
+        self.assertEqual([pair[0] for pair in pairs], sorted(pair[0] for pair in pairs))
+        self.assertTrue(all(sample1 < sample2 for cost, sample1, sample2 in pairs))
+        ties = np.array([[0., 1., 1.], [1., 0., 1.], [1., 1., 0.]])
+        self.assertEqual(multipletimewarp.cost_pairs(ties), [(1., 1, 2), (1., 1, 3), (1., 2, 3)])
+
+    def test_guide_tree(self):
+        pairwisecosts = multipletimewarp.pairwise_timewarp(self.data, self.samplelengths, self.store)[1]
+        sequential = multipletimewarp.multiple_timewarp(pairwisecosts, self.samplelengths, self.store, {})
+        for linkage in ['single', 'average']:
+            tree = multipletimewarp.guide_tree(pairwisecosts, linkage)
+            self.assertEqual(multipletimewarp.tree_samples(tree), {1, 2, 3, 4, 5})
+            self.assertEqual(sum(len(level) for level in multipletimewarp.tree_levels(tree)), 4)
+        tree = multipletimewarp.guide_tree(pairwisecosts)
+        for n_jobs in [1, 2]:
+            alignment, msa_order = multipletimewarp.tree_timewarp(tree, self.samplelengths, self.store, {},
+                                                                  n_jobs = n_jobs)
+            self.assertEqual(alignment, sequential[0])
+            self.assertEqual([entry[2] for entry in msa_order], [entry[2] for entry in sequential[1]])
+        self.assertRaises(ValueError, multipletimewarp.guide_tree, pairwisecosts, 'complete')
+
+    def test_profile_merge(self):
+        samples = self.store.samples
+        align1, align2 = {'1': range(10)}, {'2': range(13)}
+        new_align, cost, profile = multipletimewarp.profile_timewarp(samples[0], samples[1], align1, align2)
+        reference = timewarp.timewarp(self.store, align1, align2)
+        self.assertEqual(new_align, reference[0])
+        self.assertAlmostEqual(cost, reference[1])
+        new_align, cost, profile = multipletimewarp.profile_timewarp(profile, samples[2], new_align, {'3': range(8)},
+                                                                     window = 4)
+        self.assertTrue(np.allclose(profile, multipletimewarp.consensus_profile(samples, new_align)))
+
+        # coarse band of single samples: binned profiles are the binned samples
+        coarsedata = [localdist.coarsen_sample(sample, 3) for sample in samples]
+        coarse = (localdist.pairwise_localdist(coarsedata, engine = 'numpy'), 3, 2)
+        band = multipletimewarp.profile_band(samples[0], samples[1], 4, coarse, block_elements = 8)
+        expected = timewarp.approximate_band(align1, align2, coarse, 4)
+        self.assertTrue(np.array_equal(band[0], expected[0]) and np.array_equal(band[1], expected[1]))
+        approximate = multipletimewarp.profile_timewarp(samples[0], samples[1], align1, align2, 4, coarse, 8)
+        self.assertEqual(approximate[0], timewarp.timewarp(self.store, align1, align2, 4, coarse)[0])
+
+        costmatrix = multipletimewarp.pairwise_timewarp(self.data, self.samplelengths, self.store)[1]
+        tree = multipletimewarp.guide_tree(costmatrix)
+        for n_jobs in [1, 2]:
+            alignment, msa_order = multipletimewarp.tree_timewarp(tree, self.samplelengths, self.store, {},
+                                                                  n_jobs = n_jobs, merge_mode = 'profile')
+            self.assertEqual(sorted(alignment.keys()), ['1', '2', '3', '4', '5'])
+            self.assertEqual(len(set(len(indices) for indices in alignment.values())), 1)
+            for key, indices in alignment.items():
+                self.assertEqual(sorted(set(indices)), list(range(self.samplelengths[int(key)-1])))
+        self.assertRaises(ValueError, multipletimewarp.tree_timewarp, tree, self.samplelengths, self.store, {},
+                          merge_mode = 'median')
+
+    def test_star_alignment(self):
+        merged = multipletimewarp.star_merge('1', [{'1': [0, 0, 1, 2], '2': [0, 1, 2, 3]},
+                                                   {'1': [0, 1, 1, 1, 2], '3': [0, 0, 1, 2, 3]}])
+        self.assertEqual(merged, {'1': [0, 0, 1, 1, 1, 2], '2': [0, 1, 2, 2, 2, 3], '3': [0, 0, 0, 1, 2, 3]})
+
+        costmatrix = multipletimewarp.pairwise_timewarp(self.data, self.samplelengths, self.store)[1]
+        reference = multipletimewarp.medoid_sample(costmatrix)
+        self.assertEqual(reference, int(np.argmin(costmatrix.sum(axis = 0))) + 1)
+        alignment, msa_order = multipletimewarp.star_timewarp(reference, self.samplelengths, self.store)
+        self.assertEqual(len(msa_order), 4)
+        for key, indices in alignment.items():
+            self.assertEqual(len(indices), len(alignment[str(reference)]))
+            self.assertEqual(sorted(set(indices)), list(range(self.samplelengths[int(key)-1])))
+        for entry in msa_order:         # pairwise alignment costs of the reference pairs
+            self.assertAlmostEqual(entry[2], costmatrix[reference-1, entry[1]-1])
+        parallel = multipletimewarp.star_timewarp(reference, self.samplelengths, self.store, n_jobs = 2)
+        self.assertEqual(parallel[0], alignment)
+        self.assertRaises(ValueError, multipletimewarp.star_timewarp, 6, self.samplelengths, self.store)
+
+    def test_intensity_guide_tree(self):
+        costmatrix = multipletimewarp.trace_costmatrix(self.data)
+        self.assertEqual(costmatrix.shape, (5, 5))
+        self.assertTrue(np.array_equal(costmatrix, costmatrix.T))
+        traces = multipletimewarp.intensity_traces(self.data)
+        pair = localdist.array_localdist(traces[0][:, np.newaxis], traces[3][:, np.newaxis])
+        self.assertAlmostEqual(costmatrix[0, 3], timewarp.dtw(pair)[0][-1, -1])
+        self.assertTrue(np.all(multipletimewarp.trace_costmatrix(self.data, window = 3) >= costmatrix))
+
+        lazy = localdist.pairwise_localdist(self.data, engine = 'numpy', lazy = True)
+        tree = multipletimewarp.guide_tree(costmatrix)
+        alignment, msa_order = multipletimewarp.tree_timewarp(tree, self.samplelengths, lazy, {})
+        self.assertEqual(len(msa_order), 4)
+        self.assertEqual(sorted(alignment.keys()), ['1', '2', '3', '4', '5'])
+
+    def test_parallel_lazy_cells(self):
+        tree = multipletimewarp.guide_tree(multipletimewarp.trace_costmatrix(self.data))
+        serial = localdist.pairwise_localdist(self.data, engine = 'numpy', lazy = True)
+        expected = multipletimewarp.tree_timewarp(tree, self.samplelengths, serial, {})
+        lazy = localdist.pairwise_localdist(self.data, engine = 'numpy', lazy = True)
+        self.assertEqual(multipletimewarp.tree_timewarp(tree, self.samplelengths, lazy, {}, n_jobs = 2), expected)
+        # cells computed by the worker processes are kept in the store
+        self.assertTrue(np.array_equal(np.isnan(lazy.buffer), np.isnan(serial.buffer)))
+        self.assertTrue(np.array_equal(lazy.buffer[~np.isnan(lazy.buffer)], serial.buffer[~np.isnan(serial.buffer)]))
+
+        lazy = localdist.pairwise_localdist(self.data, engine = 'numpy', lazy = True)
+        multipletimewarp.star_timewarp(1, self.samplelengths, lazy, n_jobs = 2)
+        self.assertTrue(np.array_equal(lazy.grid(0, 3), self.store.grid(0, 3)))
+
+    def test_warp(self):
+        sample1 = [[0,3,8,1],[1,3,7,1],[2,1,6,1],[6,1,5,1],[7,1,4,1]]
+        sample2 = [[3,4,6,0],[8,8,6,0],[4,3,8,0],[3,7,6,0],[7,2,0,0]]
+        alignment = {'1': [0,1,2,2,3,3,4,4], '2': [0,0,0,1,2,3,3,4]}
+        repeat = multipletimewarp.datawarp([sample1, sample2], alignment)
+        self.assertEqual(repeat[1].tolist(), [[3,4,6,0],[3,4,6,0],[3,4,6,0],[8,8,6,0],
+                                              [4,3,8,0],[3,7,6,0],[3,7,6,0],[7,2,0,0]])
+        interpolated = multipletimewarp.interpolation_warp([sample1, sample2], alignment)
+        self.assertTrue(np.allclose(interpolated[0], [[0,3,8,1],[1,3,7,1],[2,1,6,1],[4,1,5.5,1],
+                                                      [6,1,5,1],[6.5,1,4.5,1],[7,1,4,1],[7,1,4,1]]))
+        self.assertTrue(np.allclose(interpolated[1], [[3,4,6,0],[14/3.,16/3.,6,0],[19/3.,20/3.,6,0],[8,8,6,0],
+                                                      [4,3,8,0],[3,7,6,0],[5,4.5,3,0],[7,2,0,0]]))
+
+    def test_warp_operator(self):
+        alignment = {'1': [0,1,2,2,3,3,4,4], '2': [0,0,0,1,2,3,3,4]}
+        data = [np.arange(20.).reshape(5, 4)**2, np.arange(20.).reshape(5, 4)[::-1]]
+        for warp_method, warp in [('repeat', multipletimewarp.datawarp),
+                                  ('interpolate', multipletimewarp.interpolation_warp)]:
+            operators = multipletimewarp.warp_operators(alignment, [5, 5], warp_method)
+            for operator, sample, warped in zip(operators, data, warp(data, alignment)):
+                self.assertEqual(operator.shape, (8, 5))
+                self.assertTrue(np.allclose(multipletimewarp.apply_warp(operator, sample), warped))
+        self.assertEqual(multipletimewarp.apply_warp(operators[1], np.arange(5.)).tolist()[-3:], [3., 3.5, 4.])
+        self.assertRaises(ValueError, multipletimewarp.apply_warp, operators[0], np.ones((4, 2)))
+        self.assertRaises(ValueError, multipletimewarp.warp_operator, [0, 1], 2, 'nearest')
+
+    def test_add_samples(self):
+        costmatrix = multipletimewarp.pairwise_timewarp(self.data[:3], self.samplelengths[:3], self.store)[1]
+        tree = multipletimewarp.guide_tree(costmatrix)
+        alignment = multipletimewarp.tree_timewarp(tree, self.samplelengths, self.store, {})[0]
+        final, msa_order = multipletimewarp.add_samples(alignment, [4, 5], self.samplelengths, self.store)
+        self.assertEqual([entry[0] for entry in msa_order], [4, 5])
+        self.assertEqual(set(msa_order[1][1]), {1, 2, 3, 4})
+        self.assertEqual(sorted(final.keys()), ['1', '2', '3', '4', '5'])
+        self.assertEqual(len(set(len(indices) for indices in final.values())), 1)
+        for key, indices in final.items():
+            self.assertEqual(sorted(set(indices)), list(range(self.samplelengths[int(key)-1])))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+from copal import localdist
+from copal import timewarp
+import unittest
+import numpy as np
+
+def list_dtw(localcost):
+    """list based dynamic time warping, as originally implemented in timewarp"""
+    al1len, al2len = len(localcost), len(localcost[0])
+    distcost = [[None] * al2len for y in range(al1len)]
+    arrows = [[(None, None)] * al2len for y in range(al1len)]
+    for y in range(al1len):
+        for x in range(al2len):
+            if y == 0 and x == 0:
+                distcost[y][x] = localcost[y][x]
+            elif y == 0:
+                distcost[y][x] = distcost[y][x-1] + localcost[y][x]
+                arrows[y][x] = (y, x-1)
+            elif x == 0:
+                distcost[y][x] = distcost[y-1][x] + localcost[y][x]
+                arrows[y][x] = (y-1, x)
+            else:
+                lowestcost = distcost[y-1][x]
+                arrows[y][x] = (y-1, x)
+                if lowestcost > distcost[y][x-1]:
+                    lowestcost = distcost[y][x-1]
+                    arrows[y][x] = (y, x-1)
+                if lowestcost > distcost[y-1][x-1]:
+                    lowestcost = distcost[y-1][x-1]
+                    arrows[y][x] = (y-1, x-1)
+                distcost[y][x] = lowestcost + localcost[y][x]
+    alignment = [(al1len-1, al2len-1)]
+    while arrows[alignment[-1][0]][alignment[-1][1]] != (None, None):
+        alignment.append(arrows[alignment[-1][0]][alignment[-1][1]])
+    alignment.reverse()
+    return alignment, distcost[-1][-1]
+
+class TestTimewarp(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(1)
+        cls.data = [rng.randint(0, 4, size = (slices, 6)).astype(float) for slices in [10, 13, 8, 11]]
+        cls.store = localdist.pairwise_localdist(cls.data, engine = 'numpy')
+        cls.entries = dict((str(i+1), {str(i+1): range(len(sample))}) for i, sample in enumerate(cls.data))
+
+    def test_dtw(self):
+        rng = np.random.RandomState(2)
+        for shape in [(1, 1), (1, 7), (6, 1), (9, 14), (17, 5)]:
+            localcost = rng.randint(0, 3, size = shape).astype(float)    # many ties
+            expected_alignment, expected_cost = list_dtw(localcost.tolist())
+            distcost, arrows = timewarp.dtw(localcost)
+            self.assertEqual(timewarp.backtrace(arrows), expected_alignment)
+            self.assertEqual(distcost[-1, -1], expected_cost)
+
+    def test_dtw_cost(self):
+        rng = np.random.RandomState(3)
+        for shape, window in [((1, 1), None), ((1, 6), None), ((5, 1), None), ((9, 14), None),
+                              ((17, 5), 1), ((12, 12), 0), ((10, 13), 0.2)]:
+            localcost = rng.rand(*shape)
+            band = None if window is None else timewarp.window_band(shape[0], shape[1], window)
+            distcost = timewarp.dtw(localcost, band)[0]
+            self.assertEqual(timewarp.dtw_cost(localcost, band), distcost.flat[-1])
+            full_band = band if band is not None else timewarp.window_band(shape[0], shape[1])
+            calls = []
+            def diagonal_costs(rows, cols):
+                calls.append(len(rows))
+                return localcost[rows, cols]
+            self.assertEqual(timewarp.dtw_cost(diagonal_costs, full_band), distcost.flat[-1])
+            self.assertLessEqual(max(calls), min(shape))       # one anti-diagonal at a time
+        self.assertRaises(ValueError, timewarp.dtw_cost, diagonal_costs)
+        cost = timewarp.timewarp_cost(self.store, self.entries['2'], self.entries['4'])
+        self.assertEqual(cost, timewarp.timewarp(self.store, self.entries['2'], self.entries['4'])[1])
+
+    def test_timewarp(self):
+        new_align, cost = timewarp.timewarp(self.store, self.entries['1'], self.entries['2'])
+        localcost = localdist.localdist(self.data[0].tolist(), self.data[1].tolist())
+        expected_alignment, expected_cost = list_dtw(localcost)
+        self.assertEqual(new_align['1'], [y for y, x in expected_alignment])
+        self.assertEqual(new_align['2'], [x for y, x in expected_alignment])
+        self.assertAlmostEqual(cost, expected_cost)
+
+    def test_local_cost_matrix(self):
+        align1 = {'1': [0, 1, 1, 2, 3], '3': [0, 0, 1, 2, 3]}
+        align2 = {'2': [0, 1, 2, 3], '4': [1, 2, 2, 3]}
+        localcost = timewarp.local_cost_matrix(self.store, align1, align2)
+        self.assertEqual(localcost.shape, (5, 4))
+        for y in range(5):
+            for x in range(4):
+                dists = [localdist.distcalc(self.data[int(key1)-1][align1[key1][y]],
+                                            self.data[int(key2)-1][align2[key2][x]])
+                         for key1 in align1 for key2 in align2]
+                self.assertAlmostEqual(localcost[y, x], np.mean(dists))
+
+    def test_window_band(self):
+        for al1len, al2len, window in [(10, 10, 0), (7, 20, 1), (20, 7, 2), (12, 15, 0.2), (1, 5, 0)]:
+            first, last = timewarp.window_band(al1len, al2len, window)
+            self.assertEqual((first[0], last[-1]), (0, al2len - 1))
+            self.assertTrue(np.all(first <= last))
+            self.assertTrue(np.all(first[1:] <= last[:-1] + 1))
+        first, last = timewarp.window_band(10, 10, 2)
+        self.assertEqual(list(first), [0, 0, 0, 1, 2, 3, 4, 5, 6, 7])
+        rows, cols = timewarp.band_cells((first, last))
+        self.assertEqual(len(rows), np.sum(last - first + 1))
+        self.assertTrue(np.all((cols >= first[rows]) & (cols <= last[rows])))
+
+    def test_window(self):
+        store = localdist.pairwise_localdist(self.data, engine = 'numpy', window = 2)
+        self.assertTrue(np.isnan(store.grid(0, 1)[0, 5]))
+        full = timewarp.timewarp(self.store, self.entries['1'], self.entries['2'])
+        wide = timewarp.timewarp(store, self.entries['1'], self.entries['2'], window = 13)
+        self.assertEqual(wide, full)
+        first, last = timewarp.window_band(10, 13, 2)
+        self.assertEqual(store.offsets[1], np.sum(last - first + 1))     # only band cells stored
+        self.assertFalse(np.isnan(store.buffer).any())
+        rows, cols = timewarp.band_cells((first, last))
+        np.testing.assert_array_equal(store.grid(0, 1)[rows, cols], self.store.grid(0, 1)[rows, cols])
+        np.testing.assert_array_equal(store.values(1, 0, np.arange(13)[:, np.newaxis], np.arange(10)),
+                                      self.store.grid(1, 0))      # cells outside band computed when needed
+
+        new_align, cost = timewarp.timewarp(store, self.entries['3'], self.entries['4'], window = 1)
+        first, last = timewarp.window_band(8, 11, 1)
+        trace = zip(new_align['3'], new_align['4'])
+        self.assertTrue(all(first[y] <= x <= last[y] for y, x in trace))
+        self.assertGreaterEqual(cost, timewarp.timewarp(self.store, self.entries['3'], self.entries['4'])[1])
+
+    def test_approximate_timewarp(self):
+        binned = localdist.coarsen_sample(self.data[0], 4)
+        self.assertEqual(binned.shape, (3, 6))
+        np.testing.assert_allclose(binned[2], self.data[0][8:].mean(axis = 0))
+
+        exact = timewarp.timewarp(self.store, self.entries['1'], self.entries['3'])
+        coarse = (self.store, 1, 0)      # unbinned: corridor is the exact path
+        self.assertEqual(timewarp.timewarp(self.store, self.entries['1'], self.entries['3'], coarse = coarse), exact)
+
+        coarsedata = [localdist.coarsen_sample(sample, 3) for sample in self.data]
+        coarse = (localdist.pairwise_localdist(coarsedata, engine = 'numpy'), 3, 2)
+        lazy = localdist.pairwise_localdist(self.data, engine = 'numpy', lazy = True)
+        align1 = {'1': list(range(10)), '2': [0, 0] + list(range(1, 9)) + [9, 10, 11, 12]}
+        align1['1'] += [9] * 4
+        new_align, cost = timewarp.timewarp(lazy, align1, self.entries['4'], coarse = coarse)
+        self.assertEqual(sorted(new_align.keys()), ['1', '2', '4'])
+        self.assertEqual(new_align['4'][-1], 10)
+        self.assertGreaterEqual(cost, timewarp.timewarp(self.store, align1, self.entries['4'])[1])
+        self.assertTrue(np.isnan(lazy.buffer).any())     # grid cells outside corridor never computed
+
+if __name__ == "__main__":
+    unittest.main()